@@ -17,7 +17,7 @@ from typing import Protocol, assert_never
 from more_itertools import unique_everseen
 
 from my.core import Paths, Res, get_files
-from my.core.sqlite import select, sqlite_connection
+from my.core.sqlite import SnapshotDelta, select, sqlite_connection
 
 
 class Config(Protocol):
@@ -89,9 +89,10 @@ EntitiesRes = Res[Person | _Message]
 def _entities() -> Iterator[EntitiesRes]:
     config = make_config()
 
+    delta = SnapshotDelta()
     for db_file in inputs():
         with sqlite_connection(db_file, immutable=True) as db:
-            yield from _handle_db(db, my_name=config.my_name)
+            yield from _handle_db(db, my_name=config.my_name, delta=delta)
 
 
 def _decode_encrypted_user_id(encrypted_user_id: str) -> str:
@@ -165,7 +166,7 @@ def test_extract_message_text() -> None:
     assert _extract_message_text(payload_type='VIDEO_CALL', payload=video_call) == 'Video call duration: 42 seconds'
 
 
-def _handle_db(db: sqlite3.Connection, *, my_name: str) -> Iterator[EntitiesRes]:
+def _handle_db(db: sqlite3.Connection, *, my_name: str, delta: SnapshotDelta) -> Iterator[EntitiesRes]:
     # For a one-to-one conversation, let M (for Myself) be the current account's numeric id and P be the peer's:
     # - conversation_info.user_id == message.conversation_id == P
     # - incoming: decode(sender_id) == P; decode(recipient_id) == M
@@ -209,11 +210,12 @@ def _handle_db(db: sqlite3.Connection, *, my_name: str) -> Iterator[EntitiesRes]
     # 'message' table:
     # - sender_name and sender_avatar_url are only populated together on a few incoming messages.
     # - Later snapshots of the same messages clear both fields, presumably during synchronization.
-    for  mid ,  conversation_id ,  sender_id ,  created           ,  is_incoming ,  payload_type ,  payload ,  reply_to_id in select(
+    # most messages are the same across snapshots, so only process the ones we haven't seen yet
+    for  mid ,  conversation_id ,  sender_id ,  created           ,  is_incoming ,  payload_type ,  payload ,  reply_to_id in delta.new_rows('message', select(
         ('id', 'conversation_id', 'sender_id', 'created_timestamp', 'is_incoming', 'payload_type', 'payload', 'reply_to_id'),
         'FROM message ORDER BY created_timestamp',
         db=db,
-    ):  # fmt: skip
+    )):  # fmt: skip
         try:
             text = _extract_message_text(payload_type=payload_type, payload=payload)
             yield _Message(
@@ -8,16 +8,22 @@ REQUIRES = [
     'gitpython',
 ]
 
+import heapq
+import json
 import shutil
-from collections.abc import Iterator, Sequence
+import sqlite3
+from collections.abc import Iterable, Iterator, Sequence
 from dataclasses import dataclass, field
 from datetime import datetime, timezone
 from pathlib import Path
-from subprocess import check_output
-from typing import cast
+from subprocess import DEVNULL, PIPE, CalledProcessError, Popen, check_output
+from typing import Literal, cast
 
 from my.core import make_config, make_logger
 from my.core.cachew import cache_dir, mcachew
+from my.core.query import ordered_by
+from my.core.sqlite import sqlite_connection
+from my.core.utils.concurrent import parallel_map
 from my.core.warnings import high
 
 from my.config import commits as user_config  # isort: skip
@@ -28,6 +34,8 @@ class commits_cfg(user_config):
     roots: Sequence[Path | str] = field(default_factory=list)
     emails: Sequence[str] | None = None
     names: Sequence[str] | None = None
+    # 'git' parses 'git log' output directly, 'gitpython' walks the commits via GitPython objects (much slower)
+    backend: Literal['git', 'gitpython'] = 'git'
 
 
 # experiment to make it lazy?
@@ -51,9 +59,13 @@ log = make_logger(__name__, level='info')
 
 def by_me(c: git.objects.commit.Commit) -> bool:
     actor = c.author
-    if actor.email in (config().emails or ()):
+    return _is_me(name=actor.name, email=actor.email, cfg=config())
+
+
+def _is_me(*, name: str | None, email: str | None, cfg: commits_cfg) -> bool:
+    if email in (cfg.emails or ()):
         return True
-    if actor.name in (config().names or ()):
+    if name in (cfg.names or ()):
         return True
     return False
 
@@ -123,13 +135,97 @@ def _repo_commits_aux(gr: git.Repo, rev: str, emitted: set[str]) -> Iterator[Com
         )
 
 
-def repo_commits(repo: Path | str):
+def _repo_commits_gitpython(repo: Path | str) -> Iterator[Commit]:
     gr = git.Repo(str(repo))
     emitted: set[str] = set()
     for r in gr.references:
         yield from _repo_commits_aux(gr=gr, rev=r.path, emitted=emitted)
 
 
+# NOTE: all fields are NUL separated, and with -z records are NUL terminated too
+# message goes last since it's the only field that can contain newlines
+# %S is the ref the commit was reached from (needs --source)
+_LOG_FORMAT = '%H%x00%S%x00%aI%x00%cI%x00%an%x00%ae%x00%B'
+_LOG_FIELDS = _LOG_FORMAT.count('%x00') + 1
+
+
+def _git_log(repo: Path, *, refs: Sequence[str], exclude: Sequence[str]) -> Iterator[list[str]]:
+    """
+    Yields fields (see _LOG_FORMAT) for commits reachable from any of refs, but not from any of exclude
+
+    All refs are walked at once, so each commit is only output once
+    """
+    # fmt: off
+    cmd = [
+        'git', '-C', str(repo),
+        'log', f'--format={_LOG_FORMAT}', '-z', '--no-show-signature', '--source',
+        '--stdin',  # passing revisions via stdin, there might be too many for the command line
+    ]
+    # fmt: on
+    with Popen(cmd, stdin=PIPE, stdout=PIPE) as p:
+        assert p.stdin is not None
+        out = p.stdout
+        assert out is not None
+        # NOTE: git reads all revisions before producing any output, so can't deadlock here
+        p.stdin.write(''.join(f'{r}\n' for r in [*refs, *(f'^{e}' for e in exclude)]).encode('utf8'))
+        p.stdin.close()
+
+        fields: list[bytes] = []
+        rest = b''
+        for chunk in iter(lambda: out.read(1 << 16), b''):
+            [*parts, rest] = (rest + chunk).split(b'\0')
+            fields.extend(parts)
+            while len(fields) >= _LOG_FIELDS:
+                yield [f.decode('utf8', errors='replace') for f in fields[:_LOG_FIELDS]]
+                del fields[:_LOG_FIELDS]
+    if p.returncode != 0:
+        raise CalledProcessError(p.returncode, cmd)
+    assert len(fields) == 0, (repo, fields)
+    assert rest == b'', (repo, rest)
+
+
+def _git_refs(repo: Path) -> list[tuple[str, str]]:
+    """
+    Returns (refname, object sha) for all refs in the repository, sorted by refname
+    """
+    out = check_output(['git', '-C', str(repo), 'for-each-ref', '--format=%(refname)%00%(objectname)'], text=True)
+    return [cast(tuple[str, str], tuple(line.split('\0'))) for line in out.splitlines()]
+
+
+def _git_commits(repo: Path, *, refs: Sequence[str], exclude: Sequence[str], cfg: commits_cfg) -> Iterator[Commit]:
+    if len(refs) == 0:
+        # otherwise git log would default to HEAD
+        return
+    git_dir = check_output(['git', '-C', str(repo), 'rev-parse', '--absolute-git-dir'], text=True).strip()
+    repo_name = str(_git_root(git_dir))
+    for sha, ref, authored, committed, name, email, message in _git_log(repo, refs=refs, exclude=exclude):
+        if not _is_me(name=name, email=email, cfg=cfg):
+            continue
+        yield Commit(
+            committed_dt=datetime.fromisoformat(committed),
+            authored_dt=datetime.fromisoformat(authored),
+            message=message.strip(),
+            repo=repo_name,
+            sha=sha,
+            ref=ref,
+        )
+
+
+def _repo_commits_git(repo: Path | str) -> Iterator[Commit]:
+    # same commits as _repo_commits_gitpython, but without instantiating GitPython objects for each commit
+    # NOTE: refs from for-each-ref are what --all would walk (minus HEAD, same as GitPython's references)
+    # if a commit is reachable from multiple refs, it might be attributed to a different one than with GitPython though
+    repo = Path(repo)
+    refs = [ref for ref, _ in _git_refs(repo)]
+    yield from _git_commits(repo, refs=refs, exclude=[], cfg=config())
+
+
+def repo_commits(repo: Path | str) -> Iterator[Commit]:
+    if config().backend == 'gitpython':
+        return _repo_commits_gitpython(repo)
+    return _repo_commits_git(repo)
+
+
 def canonical_name(repo: Path) -> str:
     # TODO could determine origin?
     if repo.match('github/repositories/*/repository'):
@@ -180,23 +276,23 @@ def repos() -> list[Path]:
     return git_repos_in(list(map(Path, config().roots)))
 
 
-# returns modification time for an index to use as hash function
-def _repo_depends_on(_repo: Path) -> int:
-    for pp in [
-        ".git/FETCH_HEAD",
-        ".git/HEAD",
-        "FETCH_HEAD",  # bare
-        "HEAD",  # bare
-    ]:
-        ff = _repo / pp
-        if ff.exists():
-            return int(ff.stat().st_mtime)
-    raise RuntimeError(f"Could not find a FETCH_HEAD/HEAD file in {_repo}")
+def _repo_ref_tips(repo: Path) -> str:
+    # NOTE: unlike FETCH_HEAD/HEAD mtime, this also catches local commits, rebases etc
+    return json.dumps(_git_refs(repo))
+
 
+def _commits(_repos: list[Path]) -> Iterator[list[Commit]]:
+    # repos are independent (and have separate caches), so can process them in parallel
+    # runs serially unless HPI_CPU_POOL is set (see my.core._cpu_pool)
+    for res in parallel_map(_repo_commits_list, _repos):
+        if isinstance(res, Exception):
+            raise res
+        yield res
 
-def _commits(_repos: list[Path]) -> Iterator[Commit]:
-    for r in _repos:
-        yield from _cached_commits(r)
+
+def _repo_commits_list(repo: Path) -> list[Commit]:
+    # NOTE: module level function, so it can be pickled to run in a process pool
+    return list(_cached_commits(repo))
 
 
 def _cached_commits_path(p: Path) -> Path | str:
@@ -205,19 +301,146 @@ def _cached_commits_path(p: Path) -> Path | str:
     return str(p)
 
 
+class _CommitIndex:
+    """
+    Persisted ref tips and commits (after filtering by author) for a single repository
+
+    Lets us only walk commits reachable from the new ref tips, but not from the ones processed previously (i.e. old..new)
+    """
+
+    def __init__(self, path: Path, *, fingerprint: str) -> None:
+        self.path = path
+        self.fingerprint = fingerprint
+        self.tips: dict[str, str] = {}
+        self.rows: list[tuple] = []
+        if not path.exists():
+            return
+        try:
+            with sqlite_connection(path) as db:
+                [(stored_fingerprint,)] = db.execute('SELECT fingerprint FROM meta')
+                if stored_fingerprint != fingerprint:
+                    log.debug('%s: author filter changed, discarding commit index', path)
+                    return
+                self.tips = dict(db.execute('SELECT ref, sha FROM tips'))
+                self.rows = list(db.execute('SELECT * FROM commits ORDER BY rowid'))
+        except (sqlite3.Error, ValueError) as e:
+            log.warning("couldn't read commit index %s, ignoring: %s", path, e)
+            self.tips = {}
+            self.rows = []
+
+    def commits(self, *, repo_name: str) -> Iterator[Commit]:
+        for sha, committed, authored, message, ref in self.rows:
+            yield Commit(
+                committed_dt=datetime.fromisoformat(committed),
+                authored_dt=datetime.fromisoformat(authored),
+                message=message,
+                repo=repo_name,
+                sha=sha,
+                ref=ref,
+            )
+
+    def save(self, *, tips: dict[str, str], new: Sequence[Commit], rebuild: bool) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with sqlite_connection(self.path) as db:
+            db.execute('CREATE TABLE IF NOT EXISTS meta (fingerprint TEXT)')
+            db.execute('CREATE TABLE IF NOT EXISTS tips (ref TEXT PRIMARY KEY, sha TEXT)')
+            db.execute('CREATE TABLE IF NOT EXISTS commits (sha TEXT PRIMARY KEY, committed TEXT, authored TEXT, message TEXT, ref TEXT)')  # fmt: skip
+            db.execute('DELETE FROM meta')
+            db.execute('INSERT INTO meta VALUES (?)', (self.fingerprint,))
+            db.execute('DELETE FROM tips')
+            db.executemany('INSERT INTO tips VALUES (?, ?)', tips.items())
+            if rebuild:
+                db.execute('DELETE FROM commits')
+            db.executemany(
+                'INSERT OR IGNORE INTO commits VALUES (?, ?, ?, ?, ?)',
+                [(c.sha, c.committed_dt.isoformat(), c.authored_dt.isoformat(), c.message, c.ref) for c in new],
+            )
+
+
+def _commit_index_path(repo: Path) -> Path | None:
+    from my.core import core_config as CC
+
+    cdir = CC.config.get_cache_dir()
+    if cdir is None:
+        return None
+    return cdir / 'my.coding.commits:_commit_index' / (str(repo.absolute()).strip('/') + '.sqlite')
+
+
+def _unreachable(repo: Path, *, old: Iterable[str], new: Iterable[str]) -> bool:
+    """
+    Whether any commits reachable from old aren't reachable from new anymore (e.g. after force push or branch deletion)
+    """
+    # fmt: off
+    cmd = [
+        'git', '-C', str(repo),
+        'rev-list', '--count', '--stdin',
+    ]
+    # fmt: on
+    # NOTE: fails if old commits are missing altogether (e.g. after gc), so also needs rebuilding
+    stdin = ''.join([*(f'{o}\n' for o in old), *(f'^{n}\n' for n in new)])
+    try:
+        count = check_output(cmd, input=stdin, text=True, stderr=DEVNULL)
+    except CalledProcessError:
+        return True
+    return int(count) > 0
+
+
+def _repo_commits_incremental(repo: Path) -> Iterator[Commit]:
+    path = _commit_index_path(repo)
+    if path is None:
+        yield from _repo_commits_git(repo)
+        return
+
+    cfg = config()
+    fingerprint = json.dumps({'emails': sorted(cfg.emails or ()), 'names': sorted(cfg.names or ())})
+    index = _CommitIndex(path, fingerprint=fingerprint)
+    tips = dict(_git_refs(repo))
+
+    old_tips = set(index.tips.values())
+    # if some old commits got unreachable, have to start from scratch, otherwise the index would keep them
+    rebuild = len(old_tips) == 0 or _unreachable(repo, old=old_tips, new=tips.values())
+    if rebuild:
+        old_tips = set()
+    else:
+        git_dir = check_output(['git', '-C', str(repo), 'rev-parse', '--absolute-git-dir'], text=True).strip()
+        yield from index.commits(repo_name=str(_git_root(git_dir)))
+
+    changed = [ref for ref, sha in tips.items() if sha not in old_tips]
+    new = []
+    for c in _git_commits(repo, refs=changed, exclude=sorted(old_tips), cfg=cfg):
+        new.append(c)
+        yield c
+    log.debug('%s: %d new commits (rebuild: %s)', repo, len(new), rebuild)
+    index.save(tips=tips, new=new, rebuild=rebuild)
+
+
 # per-repo commits, to use cachew
 @mcachew(
-    depends_on=_repo_depends_on,
+    depends_on=_repo_ref_tips,
     logger=log,
     cache_path=_cached_commits_path,  # type: ignore[arg-type]  # ty: ignore[invalid-argument-type] # hmm mypy seems confused here? likely a but in type + paramspec handling...
 )
 def _cached_commits(repo: Path) -> Iterator[Commit]:
     log.debug('processing %s', repo)
-    yield from repo_commits(repo)
+    if config().backend == 'gitpython':
+        yield from repo_commits(repo)
+    else:
+        yield from _repo_commits_incremental(repo)
 
 
+@ordered_by('dt')
 def commits() -> Iterator[Commit]:
-    return _commits(repos())
+    for repo_commits_ in _commits(repos()):
+        yield from repo_commits_
+
+
+@ordered_by('dt', is_sorted=True)
+def sorted_commits() -> Iterator[Commit]:
+    """
+    Same as commits(), but in commit date order
+    """
+    by_dt = lambda c: c.dt
+    yield from heapq.merge(*(sorted(cs, key=by_dt) for cs in _commits(repos())), key=by_dt)
 
 
 # TODO enforce read only? although it doesn't touch index
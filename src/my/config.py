@@ -145,6 +145,7 @@ class commits:
     emails: Sequence[str] | None
     names: Sequence[str] | None
     roots: Sequence[Path | str]
+    backend: Literal['git', 'gitpython']
 
 
 class pdfs:
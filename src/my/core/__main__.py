@@ -559,20 +559,60 @@ def query_hpi_functions(
     warn_exceptions: bool,
     raise_exceptions: bool,
     drop_exceptions: bool,
+    max_in_memory: int | None = None,
+    parallel: bool = False,
 ) -> None:
-    from .query_range import RangeTuple, select_range
+    from datetime import date, datetime
+
+    from .query import call_with_range, order_info
+    from .query_range import RangeTuple, datetime_range_hint, select_range
+
+    unparsed_range = RangeTuple(after=after, before=before, within=within)
+
+    funcs = list(_locate_functions_or_prompt(qualified_names))
+
+    # if the functions declare which datetime attribute they're ordered by (see my.core.query.ordered_by),
+    # use that instead of searching each item for a datetime. if there's just one, and it's already sorted,
+    # select_range doesn't need to sort it again
+    order_by = None
+    presorted = False
+    infos = [order_info(f) for f in funcs]
+    if order_key is None and order_by_value_type in [datetime, date] and len(infos) > 0:
+        keys = {None if i is None else i.key for i in infos}
+        if len(keys) == 1 and infos[0] is not None:
+            order_by = infos[0].order_func()
+            presorted = len(infos) == 1 and infos[0].is_sorted
+
+    # if the range is on the datetime the provider would be ordered by, let
+    # providers which support it (accept since/until kwargs) skip data outside the range.
+    # with an explicit --order-key, that might be some other datetime, so don't push down
+    since, until = None, None
+    if order_key is None and order_by_value_type is datetime:
+        since, until = datetime_range_hint(unparsed_range)
 
     # chain list of functions from user, in the order they wrote them on the CLI
-    input_src = chain(*(f() for f in _locate_functions_or_prompt(qualified_names)))
+    input_src: Iterable[Any]
+    if len(funcs) == 1:
+        # pass the result through as is, if it's a sorted list select_range can binary search it
+        input_src = call_with_range(funcs[0], since=since, until=until)
+    elif parallel:
+        from .utils.concurrent import iterate_parallel
+
+        # run the functions at the same time, items from different functions are interleaved
+        input_src = iterate_parallel([functools.partial(call_with_range, f, since=since, until=until) for f in funcs])
+    else:
+        input_src = chain(*(call_with_range(f, since=since, until=until) for f in funcs))
 
     # NOTE: if passing just one function to this which returns a single namedtuple/dataclass,
     # using both --order-key and --order-type will often be faster as it does not need to
-    # duplicate the iterator in memory, or try to find the --order-type type on each object before sorting
+    # try to find the --order-type type on each object before sorting
     res = select_range(
         input_src,
+        order_by=order_by,
         order_key=order_key,
         order_by_value_type=order_by_value_type,
-        unparsed_range=RangeTuple(after=after, before=before, within=within),
+        unparsed_range=unparsed_range,
+        presorted=presorted,
         reverse=reverse,
         limit=limit,
         drop_unsorted=drop_unsorted,
@@ -581,6 +621,7 @@ def query_hpi_functions(
         warn_func=_warn_exceptions,
         raise_exceptions=raise_exceptions,
         drop_exceptions=drop_exceptions,
+        max_in_memory=max_in_memory,
     )
 
     if output == 'json':
@@ -948,6 +989,19 @@ def dev_diff_cmd(
 @click.option(
     '--drop-exceptions', default=False, is_flag=True, help='ignore any errors returned as objects from the functions'
 )
+@click.option(
+    '--max-in-memory',
+    default=None,
+    type=click.IntRange(min=1),
+    envvar='HPI_QUERY_MAX_IN_MEMORY',
+    help='while ordering, keep at most this many items in memory, spilling the rest to temporary files on disk',
+)
+@click.option(
+    '--parallel/--no-parallel',
+    default=False,
+    envvar='HPI_QUERY_PARALLEL',
+    help='when querying multiple functions, run them at the same time (results from them are interleaved)',
+)
 @click.argument('FUNCTION_NAME', nargs=-1, required=True, shell_complete=_module_autocomplete)
 def query_cmd(
     *,
@@ -967,6 +1021,8 @@ def query_cmd(
     warn_exceptions: bool,
     raise_exceptions: bool,
     drop_exceptions: bool,
+    max_in_memory: int | None,
+    parallel: bool,
 ) -> None:
     '''
     This allows you to query the results from one or more functions in HPI
@@ -1034,6 +1090,8 @@ def query_cmd(
             warn_exceptions=warn_exceptions,
             raise_exceptions=raise_exceptions,
             drop_exceptions=drop_exceptions,
+            max_in_memory=max_in_memory,
+            parallel=parallel,
         )
     except QueryException as qe:
         eprint(str(qe))
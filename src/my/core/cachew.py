@@ -119,7 +119,7 @@ def _mcachew_impl(cache_path=_cache_path_dflt, **kwargs):
 
 
 if TYPE_CHECKING:
-    type PathProvider[**P] = Path | str | Callable[P, Path | str]
+    type PathProvider[**P] = Path | str | Callable[P, Path | str | None]
     # NOTE: in cachew, HashFunction type returns str
     # however in practice, cachew always calls str for its result
     # so perhaps better to switch it to Any in cachew as well
@@ -8,6 +8,7 @@ python3 -c "from my.core.query import select; help(select)"
 from __future__ import annotations
 
 import dataclasses
+import heapq
 import importlib
 import inspect
 import itertools
@@ -20,6 +21,7 @@ import more_itertools
 from . import error as err
 from .error import Res, unwrap
 from .types import is_namedtuple
+from .utils.itertools import external_sorted
 from .warnings import low
 
 type ET[T] = Res[T]
@@ -76,6 +78,73 @@ def locate_qualified_function(qualified_name: str) -> Callable[[], Iterable[ET]]
     return locate_function(qualified_name[:rdot_index], qualified_name[rdot_index + 1 :])
 
 
+def call_with_range(
+    func: Callable[..., Iterable[ET]],
+    *,
+    since: datetime | None = None,
+    until: datetime | None = None,
+) -> Iterable[ET]:
+    """
+    Calls a data provider, passing it a range hint if it accepts one
+
+    Providers opt in by accepting 'since' and/or 'until' keyword arguments
+    (tz-aware datetimes, since is inclusive, until is exclusive), which lets
+    them push the range into a SQL query or skip files entirely
+
+    This is just a hint -- providers may return items outside the range,
+    so the results still have to be filtered afterwards (see select_range)
+    """
+    if since is None and until is None:
+        return func()
+    try:
+        params = inspect.signature(func).parameters
+    except (TypeError, ValueError):
+        # builtins/some C extensions don't have a signature
+        return func()
+    kwargs: dict[str, datetime] = {}
+    for name, value in (('since', since), ('until', until)):
+        param = params.get(name)
+        if value is None or param is None:
+            continue
+        if param.kind in (inspect.Parameter.KEYWORD_ONLY, inspect.Parameter.POSITIONAL_OR_KEYWORD):
+            kwargs[name] = value
+    return func(**kwargs)
+
+
+class OrderInfo(NamedTuple):
+    # attribute which holds the datetime of the items the function returns
+    key: str
+    # whether the items are already sorted by it (ascending)
+    is_sorted: bool = False
+
+    def order_func(self) -> OrderFunc[Any, Any]:
+        key = self.key
+        return lambda o: None if isinstance(o, Exception) else getattr(o, key, None)
+
+
+_ORDER_INFO_ATTR = '_hpi_order_info'
+
+
+def ordered_by[F: Callable[..., Any]](key: str, *, is_sorted: bool = False) -> Callable[[F], F]:
+    """
+    Lets a data provider declare which attribute its items are ordered by (e.g. 'dt'),
+    and whether it already returns them sorted
+
+    hpi query uses that instead of searching each item for a datetime,
+    and if the items are sorted, doesn't have to sort them again
+    """
+
+    def decorator(func: F) -> F:
+        setattr(func, _ORDER_INFO_ATTR, OrderInfo(key=key, is_sorted=is_sorted))
+        return func
+
+    return decorator
+
+
+def order_info(func: Callable[..., Any]) -> OrderInfo | None:
+    return getattr(func, _ORDER_INFO_ATTR, None)
+
+
 def attribute_func[T, U](obj: Any, where: Where[T], default: U | None = None) -> OrderFunc[T, U] | None:
     """
     Attempts to find an attribute which matches the 'where_function' on the object,
@@ -261,15 +330,43 @@ def _wrap_unsorted[T, U](
     return iter(unsortable), iter(sortable)
 
 
+# same as _wrap_unsorted, but doesn't keep sortable items in memory
+# the unsortable items are only all collected after the second iterator is exhausted
+def _wrap_unsorted_lazy[T, U](
+    itr: Iterator[ET[T]], orderfunc: OrderFunc[T, U]
+) -> tuple[Iterator[Unsortable], Iterator[ET[T]]]:
+    unsortable: list[Unsortable] = []
+
+    def sortable() -> Iterator[ET[T]]:
+        for o in itr:
+            if isinstance(o, Unsortable):
+                unsortable.append(o)
+                continue
+            ordval = orderfunc(o)
+            if ordval is None:
+                unsortable.append(Unsortable(o))
+            else:
+                yield o
+
+    return iter(unsortable), sortable()
+
+
 # return two iterators, the first being the wrapped unsortable items,
 # the second being items for which orderfunc returned a non-none value
 def _handle_unsorted[T, U](
-    itr: Iterator[ET[T]], *, orderfunc: OrderFunc[T, U], drop_unsorted: bool, wrap_unsorted: bool
+    itr: Iterator[ET[T]],
+    *,
+    orderfunc: OrderFunc[T, U],
+    drop_unsorted: bool,
+    wrap_unsorted: bool,
+    lazy: bool = False,
 ) -> tuple[Iterator[Unsortable], Iterator[ET[T]]]:
     # prefer drop_unsorted to wrap_unsorted, if both were present
     if drop_unsorted:
         return iter([]), _drop_unsorted(itr, orderfunc)
     elif wrap_unsorted:
+        if lazy:
+            return _wrap_unsorted_lazy(itr, orderfunc)
         return _wrap_unsorted(itr, orderfunc)
     else:
         # neither flag was present
@@ -277,32 +374,26 @@ def _handle_unsorted[T, U](
 
 
 # handles creating an order_value function, using a lookup for
-# different types. ***This consumes the iterator***, so
-# you should definitely itertoolts.tee it beforehand
-# as to not exhaust the values
-def _generate_order_value_func[T, U](
-    itr: Iterator[ET[T]], order_value: Where[T], default: U | None = None
-) -> OrderFunc[T, U]:
+# different types. The function for each type is generated from
+# the first object of that type it's called with
+def _generate_order_value_func[T, U](order_value: Where[T], default: U | None = None) -> OrderFunc[T, U]:
     # TODO: add a kwarg to force lookup for every item? would sort of be like core.common.guess_datetime then
     order_by_lookup: dict[Any, OrderFunc[T, U]] = {}
 
-    # need to go through a copy of the whole iterator here to
-    # pre-generate functions to support sorting mixed types
-    for obj_res in itr:
-        key: Any = _determine_order_by_value_key(obj_res)
-        if key not in order_by_lookup:
-            keyfunc: OrderFunc[T, U] | None = _generate_order_by_func(
-                obj_res, where_function=order_value, default=default, force_unsortable=True
-            )
+    # note: this used to go through a copy of the whole iterator (itertools.tee) to pre-generate
+    # functions to support sorting mixed types -- but generating them on the fly gives the same
+    # result without keeping everything in memory
+    def order_func(o: ET[T]) -> U | None:
+        key: Any = _determine_order_by_value_key(o)
+        keyfunc = order_by_lookup.get(key)
+        if keyfunc is None:
+            keyfunc = _generate_order_by_func(o, where_function=order_value, default=default, force_unsortable=True)
             # should never be none, as we have force_unsortable=True
             assert keyfunc is not None
             order_by_lookup[key] = keyfunc
+        return keyfunc(o)
 
-    # todo: cache results from above _determine_order_by_value_key call and use here somehow?
-    # would require additional state
-    # order_by_lookup[_determine_order_by_value_key(o)] returns a function which
-    # accepts o, and returns the value which sorted can use to order this by
-    return lambda o: order_by_lookup[_determine_order_by_value_key(o)](o)
+    return order_func
 
 
 # handles the arguments from the user, creating a order_value function
@@ -333,8 +424,7 @@ def _handle_generate_order_by[T, U](
             raise QueryException(f"Error while ordering: could not find {order_key} on {first_item}")
         return order_by_chosen, itr
     if order_value is not None:
-        itr, itr2 = itertools.tee(itr, 2)
-        order_by_chosen = _generate_order_value_func(itr2, order_value, default)
+        order_by_chosen = _generate_order_value_func(order_value, default)
         return order_by_chosen, itr
     raise QueryException("Could not determine a way to order src iterable - at least one of the order args must be set")
 
@@ -355,6 +445,7 @@ def select[T, U](
     warn_func: Callable[[Exception], None] | None = None,
     drop_exceptions: bool = False,
     raise_exceptions: bool = False,
+    max_in_memory: int | None = None,
 ) -> Iterator[ET[T]]:
     """
     A function to query, order, sort and filter items from one or more sources
@@ -393,8 +484,7 @@ def select[T, U](
     but it can always be improved by providing a more complete guess function
 
     Note that 'order_value' is also the most computationally expensive, as it has
-    to copy the iterator in memory (using itertools.tee) to determine how to order it
-    in memory
+    to inspect the type of every item to determine how to order it
 
     The 'drop_exceptions', 'raise_exceptions', 'warn_exceptions' let you ignore or raise
     when the src contains exceptions. The 'warn_func' lets you provide a custom function
@@ -421,7 +511,8 @@ def select[T, U](
 
     reverse:        reverse the order of the resulting iterable
 
-    limit:          limit the results to this many items
+    limit:          limit the results to this many items. If combined with ordering,
+                    only keeps 'limit' items in memory while sorting
 
     drop_unsorted:  before ordering, drop any items from the iterable for which a
                     order could not be determined. False by default
@@ -432,6 +523,10 @@ def select[T, U](
     drop_exceptions: ignore any exceptions from the src
 
     raise_exceptions: raise exceptions when received from the input src
+
+    max_in_memory:  while ordering, keep at most this many items in memory, spilling
+                    the rest to temporary files on disk (the items have to be picklable).
+                    By default everything is sorted in memory
     """
 
     it: Iterable[ET] = []  # default
@@ -490,15 +585,32 @@ Will attempt to call iter() on the value""")
         # note: can't just attach sort unsortable values in the same iterable as the
         # other items because they don't have any lookups for order_key or functions
         # to handle items in the order_by_lookup dictionary
+        # if we only need the first 'limit' items, can use a bounded heap instead of sorting everything
+        use_top_k = limit is not None and (max_in_memory is None or limit <= max_in_memory)
+
         unsortable, itr = _handle_unsorted(
             itr,
             orderfunc=order_by_chosen,
             drop_unsorted=drop_unsorted,
             wrap_unsorted=wrap_unsorted,
+            lazy=use_top_k or max_in_memory is not None,
         )
 
         # run the sort, with the computed order by function
-        itr = iter(sorted(itr, key=order_by_chosen, reverse=reverse))  # type: ignore[arg-type]  # ty: ignore[no-matching-overload]
+        if use_top_k:
+            assert limit is not None  # make mypy happy
+            # note: these are equivalent to sorted(...)[:limit], including stability
+            top_k = heapq.nlargest if reverse else heapq.nsmallest
+            itr = iter(top_k(limit, itr, key=order_by_chosen))  # type: ignore[arg-type]  # ty: ignore[no-matching-overload]
+        elif max_in_memory is None:
+            itr = iter(sorted(itr, key=order_by_chosen, reverse=reverse))  # type: ignore[arg-type]  # ty: ignore[no-matching-overload]
+        else:
+            sorted_itr = more_itertools.peekable(
+                external_sorted(itr, key=order_by_chosen, reverse=reverse, chunk_size=max_in_memory)
+            )
+            # force the sort to consume the input, so all unsortable items are collected
+            sorted_itr.peek(None)
+            itr = sorted_itr
 
         # re-attach unsortable values to the front/back of the list
         if reverse:
@@ -668,6 +780,88 @@ def test_drop_unsorted() -> None:
     assert Counter(type(t).__name__ for t in res) == Counter({"_A": 4})
 
 
+def test_max_in_memory() -> None:
+    by_datetime = lambda o: isinstance(o, datetime)
+    cases: list[dict[str, Any]] = [
+        {'order_value': by_datetime},
+        {'order_value': by_datetime, 'reverse': True},
+        {'order_key': 'z'},  # wraps unsortable
+        {'order_key': 'z', 'reverse': True},
+        {'order_key': 'z', 'drop_unsorted': True},
+    ]
+    for kwargs in cases:
+        expected = list(select(_mixed_iter(), **kwargs))
+        # spills to disk
+        assert list(select(_mixed_iter(), max_in_memory=2, **kwargs)) == expected
+        # fits in memory
+        assert list(select(_mixed_iter(), max_in_memory=100, **kwargs)) == expected
+
+
+def test_order_with_limit() -> None:
+    import random
+
+    items = [_Int(random.randint(0, 10)) for _ in range(100)]
+    for reverse in [False, True]:
+        for limit in [0, 1, 5, 200]:
+            expected = sorted(items, key=lambda i: i.x, reverse=reverse)[:limit]
+            res = list(select(items, order_key='x', reverse=reverse, limit=limit))
+            assert res == expected
+            # ties should be in the same order as with the full sort
+            assert [id(r) for r in res] == [id(e) for e in expected]
+
+    # unsortable items still go first (or last, if reversed)
+    mixed = list(select(_mixed_iter(), order_key="z", limit=3))
+    assert [type(t).__name__ for t in mixed] == ["Unsortable", "Unsortable", "_A"]
+    mixed = list(select(_mixed_iter(), order_key="z", limit=3, reverse=True))
+    assert mixed == list(itertools.islice(select(_mixed_iter(), order_key="z", reverse=True), 3))
+
+
+def test_call_with_range() -> None:
+    from datetime import UTC
+
+    dts = [datetime(2020, 1, d, tzinfo=UTC) for d in range(1, 6)]
+
+    def no_hint() -> Iterator[datetime]:
+        yield from dts
+
+    def with_hint(*, since: datetime | None = None, until: datetime | None = None) -> Iterator[datetime]:
+        for dt in dts:
+            if since is not None and dt < since:
+                continue
+            if until is not None and dt >= until:
+                continue
+            yield dt
+
+    def only_since(since: datetime | None = None) -> Iterator[datetime]:
+        return with_hint(since=since)
+
+    since, until = dts[1], dts[3]
+    assert list(call_with_range(no_hint, since=since, until=until)) == dts
+    assert list(call_with_range(with_hint)) == dts
+    assert list(call_with_range(with_hint, since=since, until=until)) == dts[1:3]
+    assert list(call_with_range(with_hint, until=until)) == dts[:3]
+    assert list(call_with_range(only_since, since=since, until=until)) == dts[1:]
+
+
+def test_ordered_by() -> None:
+    @ordered_by('x', is_sorted=True)
+    def sorted_src() -> Iterator[_Int]:
+        yield from map(_Int, range(3))
+
+    def src() -> Iterator[_Int]:
+        yield from sorted_src()
+
+    assert order_info(src) is None
+    info = order_info(sorted_src)
+    assert info is not None
+    assert info == OrderInfo(key='x', is_sorted=True)
+    order_func = info.order_func()
+    assert order_func(_Int(2)) == 2
+    assert order_func(RuntimeError('whoops')) is None
+    # still just a regular function
+    assert list(sorted_src()) == [_Int(0), _Int(1), _Int(2)]
+
+
 def test_drop_exceptions() -> None:
 
     assert more_itertools.ilen(_mixed_iter_errors()) == 7
@@ -11,9 +11,11 @@ from __future__ import annotations
 
 import re
 import time
-from collections.abc import Callable, Iterator
-from datetime import date, datetime, timedelta
+from bisect import bisect_left
+from collections.abc import Callable, Iterable, Iterator, Sequence
+from datetime import UTC, date, datetime, timedelta
 from functools import cache
+from itertools import islice
 from typing import Any, NamedTuple
 
 import more_itertools
@@ -23,6 +25,7 @@ from .query import (
     OrderFunc,
     QueryException,
     Where,
+    _drop_unsorted,
     _handle_generate_order_by,
     select,
 )
@@ -173,7 +176,36 @@ def _parse_range(
     return RangeTuple(after=after, before=before, within=within)
 
 
-def _create_range_filter[T](
+def _range_bounds(rn: RangeTuple, *, default_before: Any | None = None) -> tuple[Any | None, Any | None]:
+    """
+    Converts a parsed range into its (lower, upper) boundaries -- values are
+    allowed if lower <= value < upper, a None boundary is unbounded
+    """
+    after, before, within = rn
+    if after is not None:
+        if before is not None:
+            # squeeze between before/after
+            return after, before
+        elif within is not None:
+            # after some start point + some range
+            return after, after + within
+        else:
+            return after, None
+    elif before is not None:
+        if within is not None:
+            # before a startpoint + some range
+            return before - within, before
+        else:
+            # just before the startpoint
+            return None, before
+    else:
+        # only specified within, default before to now
+        if default_before is None:
+            raise QueryException("Only received a range length, with no start or end point to compare against")
+        return default_before - within, default_before
+
+
+def _create_range_position[T](
     *,
     unparsed_range: RangeTuple,
     end_parser: Converter,
@@ -183,7 +215,7 @@ def _create_range_filter[T](
     default_before: Any | None = None,
     value_coercion_func: Converter | None = None,
     error_message: str | None = None,
-) -> Where[T] | None:
+) -> Callable[[ET[T]], int] | None:
     """
     Handles:
         - parsing the user input into values that are comparable to items the iterable returns
@@ -205,8 +237,8 @@ def _create_range_filter[T](
     data from an iterable from the last week, you could specify default_before to be now (time.time()),
     and unparsed_range.within to be 7 days
 
-    Creates a predicate that checks if some item from the iterator is
-    within some range. this is typically used for datelike input, but the user could
+    Creates a function that checks where some item from the iterator is relative
+    to some range -- returns -1 if before the range, 0 if within and 1 if after it. this is typically used for datelike input, but the user could
     specify an integer or float item to order the values by/in some timeframe
 
     It requires the value you're comparing by to support comparable/addition operators (=, <, >, +, -)
@@ -231,57 +263,138 @@ def _create_range_filter[T](
     if rn is None:
         return None
 
-    after = rn.after
-    before = rn.before
-    within = rn.within
-
     # hmm... not sure how to correctly manage
     # inclusivity here? Is [after, before) currently,
     # items are included on the lower bound but not the
     # upper bound
     # typically used for datetimes so doesn't have to
     # be exact in that case
-    def generated_predicate(obj: T | Exception) -> bool:
+    lower, upper = _range_bounds(rn, default_before=default_before)
+
+    def generated_position(obj: T | Exception) -> int:
         ov = attr_func(obj)
         if value_coercion_func is not None:
             ov = value_coercion_func(ov)
-        if after is not None:
-            if before is not None:
-                # squeeze between before/after
-                return ov >= after and ov < before
-            elif within is not None:
-                # after some start point + some range
-                allow_before = after + within
-                return ov >= after and ov < allow_before
-            else:
-                return ov >= after
-        elif before is not None:
-            if within is not None:
-                allow_after = before - within
-                # before a startpoint + some range
-                return ov >= allow_after and ov < before
-            else:
-                # just before the startpoint
-                return ov < before
-        else:
-            # only specified within, default before to now
-            if default_before is None:
-                raise QueryException("Only received a range length, with no start or end point to compare against")
-            allow_after = default_before - within
-            return ov >= allow_after and ov < default_before
+        if lower is not None and ov < lower:
+            return -1
+        if upper is not None and ov >= upper:
+            return 1
+        return 0
+
+    return generated_position
+
+
+def _create_range_filter[T](
+    *,
+    unparsed_range: RangeTuple,
+    end_parser: Converter,
+    within_parser: Converter,
+    attr_func: Where[T],
+    parsed_range: RangeTuple | None = None,
+    default_before: Any | None = None,
+    value_coercion_func: Converter | None = None,
+    error_message: str | None = None,
+) -> Where[T] | None:
+    """
+    Creates a predicate that checks if some item from the iterator is within some range,
+    see _create_range_position for the arguments
+    """
+    position = _create_range_position(
+        unparsed_range=unparsed_range,
+        end_parser=end_parser,
+        within_parser=within_parser,
+        attr_func=attr_func,
+        parsed_range=parsed_range,
+        default_before=default_before,
+        value_coercion_func=value_coercion_func,
+        error_message=error_message,
+    )
+    if position is None:
+        return None
+    return lambda obj: position(obj) == 0
+
+
+def _take_range[T](
+    itr: Iterator[ET[T]],
+    position: Callable[[ET[T]], int],
+    *,
+    presorted: bool = True,
+) -> Iterator[ET[T]]:
+    """
+    Filters items to the ones within the range. If the input is presorted,
+    stops consuming it at the first item past the end of the range
+    """
+    for o in itr:
+        pos = position(o)
+        if pos == 0:
+            yield o
+        elif pos > 0 and presorted:
+            return
+
+
+def _bisect_range[T](
+    seq: Sequence[ET[T]],
+    orderfunc: OrderFunc,
+    position: Callable[[ET[T]], int],
+) -> tuple[int, int]:
+    """
+    Given a sequence sorted by orderfunc, returns the (lo, hi) indices so that
+    seq[lo:hi] contains all sortable items within the range
+    Unsortable items (e.g. exceptions) can be anywhere in the sequence, they're
+    skipped over when comparing
+    """
+    n = len(seq)
+
+    def position_at(i: int) -> int:
+        # position of the first sortable item at/after i (or past the range, if there are none)
+        while i < n:
+            o = seq[i]
+            if orderfunc(o) is not None:
+                return position(o)
+            i += 1
+        return 1
+
+    indices = range(n)
+    lo = bisect_left(indices, 0, key=position_at)
+    hi = bisect_left(indices, 1, lo=lo, key=position_at)
+    return lo, hi
+
+
+def datetime_range_hint(unparsed_range: RangeTuple) -> tuple[datetime | None, datetime | None]:
+    """
+    Parses a datetime range the same way select_range does, returning tz-aware (UTC)
+    (since, until) boundaries -- since is inclusive, until is exclusive
 
-    return generated_predicate
+    This is passed to providers which accept a range hint (see my.core.query.call_with_range)
+    If the range only has 'within', until is left unbounded, since 'now' is computed
+    again while filtering, and the hint should never be narrower than the filter
+    """
+    rn = _parse_range(
+        unparsed_range=unparsed_range,
+        end_parser=parse_datetime_float,
+        within_parser=parse_timedelta_float,
+    )
+    if rn is None:
+        return None, None
+    lower, upper = _range_bounds(rn, default_before=time.time())
+    if rn.after is None and rn.before is None:
+        upper = None
+    since = None if lower is None else datetime.fromtimestamp(lower, tz=UTC)
+    until = None if upper is None else datetime.fromtimestamp(upper, tz=UTC)
+    return since, until
 
 
 # main interface to this file from my.core.__main__.py
 def select_range[T](
-    itr: Iterator[ET[T]],
+    itr: Iterable[ET[T]],
     *,
     where: Where[T] | None = None,
+    order_by: OrderFunc | None = None,
     order_key: str | None = None,
     order_value: Where[T] | None = None,
     order_by_value_type: type | None = None,
     unparsed_range: RangeTuple | None = None,
+    presorted: bool = False,
     reverse: bool = False,
     limit: int | None = None,
     drop_unsorted: bool = False,
@@ -290,12 +403,13 @@ def select_range[T](
     warn_func: Callable[[Exception], None] | None = None,
     drop_exceptions: bool = False,
     raise_exceptions: bool = False,
+    max_in_memory: int | None = None,
 ) -> Iterator[ET[T]]:
     """
     A specialized select function which offers generating functions
     to filter/query ranges from an iterable
 
-    order_key and order_value are used in the same way they are in select
+    order_by, order_key and order_value are used in the same way they are in select
 
     If you specify order_by_value_type, it tries to search for an attribute
     on each object/type which has that type, ordering the iterable by that value
@@ -307,12 +421,25 @@ def select_range[T](
     (this is typically parsed/created in my.core.__main__, from CLI flags
 
     If you specify a range, drop_unsorted is forced to be True
+
+    presorted means the input is already sorted (ascending) by the value we're ordering by.
+    Then if you specify a range, this doesn't sort the items again, and stops
+    consuming the input once it's past the end of the range. If the input is
+    a sequence (e.g. a list), the range is found with a binary search instead
+
+    max_in_memory is passed to select, to spill items to disk while sorting
     """
 
     # if the user specified a range with no data, set the unparsed_range to None
     if unparsed_range == RangeTuple(None, None, None):
         unparsed_range = None
 
+    # if the input is a sorted sequence, we can binary search for the range later
+    # (unless we have to raise/warn about exceptions, which could be anywhere in it)
+    seq: Sequence[ET[T]] | None = None
+    if presorted and isinstance(itr, Sequence) and not raise_exceptions and not warn_exceptions:
+        seq = itr
+
     # some operations to do before ordering/filtering
     if drop_exceptions or raise_exceptions or where is not None or warn_exceptions:
         # doesn't wrap unsortable items, because we pass no order related kwargs
@@ -335,10 +462,10 @@ def select_range[T](
 
     # if the user supplied a order_key, and/or we've generated an order_value, create
     # the function that accesses that type on each value in the iterator
-    if order_key is not None or order_value is not None:
-        # _generate_order_value_func internally here creates a copy of the iterator, which has to
-        # be consumed in-case we're sorting by mixed types
-        order_by_chosen, itr = _handle_generate_order_by(itr, order_key=order_key, order_value=order_value)
+    if order_by is not None or order_key is not None or order_value is not None:
+        order_by_chosen, itr = _handle_generate_order_by(
+            itr, order_by=order_by, order_key=order_key, order_value=order_value
+        )
         # signifies that itr is empty -- can early return here
         if order_by_chosen is None:
             return itr
@@ -349,12 +476,9 @@ def select_range[T](
             raise QueryException("""Can't order by range if we have no way to order_by!
 Specify a type or a key to order the value by""")
 
-        # force drop_unsorted=True so we can use _create_range_filter
-        # sort the iterable by the generated order_by_chosen function
-        itr = select(itr, order_by=order_by_chosen, drop_unsorted=True)
-        filter_func: Where[T] | None
+        range_position: Callable[[ET[T]], int] | None
         if order_by_value_type in [datetime, date]:
-            filter_func = _create_range_filter(
+            range_position = _create_range_position(
                 unparsed_range=unparsed_range,
                 end_parser=parse_datetime_float,
                 within_parser=parse_timedelta_float,
@@ -364,7 +488,7 @@ Specify a type or a key to order the value by""")
             )
         elif order_by_value_type in [int, float]:
             # allow primitives to be converted using the default int(), float() callables
-            filter_func = _create_range_filter(
+            range_position = _create_range_position(
                 unparsed_range=unparsed_range,
                 end_parser=order_by_value_type,
                 within_parser=order_by_value_type,
@@ -378,9 +502,32 @@ Specify a type or a key to order the value by""")
             # (seems like a lot?)
             raise QueryException("Sorting by custom types is currently unsupported")
 
-        # use the created filter function
+        if seq is not None and range_position is not None:
+            lo, hi = _bisect_range(seq, order_by_chosen, range_position)
+            # same pipeline as for the whole input above, only applied to the slice
+            itr = select(seq[lo:hi], where=where, drop_exceptions=drop_exceptions)
+        # force dropping unsorted items so we can use _create_range_position
+        itr = _drop_unsorted(iter(itr), order_by_chosen)
+        if presorted and not reverse:
+            # already in the right order, can stream the items and stop once past the range
+            if range_position is not None:
+                itr = _take_range(itr, range_position)
+            if limit is not None:
+                itr = islice(itr, limit)
+            return itr
+        # filter before sorting, so only items in the range have to be sorted
         # we've already applied drop_exceptions and kwargs related to unsortable values above
-        itr = select(itr, where=filter_func, limit=limit, reverse=reverse)
+        if range_position is not None:
+            itr = _take_range(itr, range_position, presorted=presorted)
+        # sort the iterable by the generated order_by_chosen function
+        itr = select(
+            itr,
+            order_by=order_by_chosen,
+            wrap_unsorted=False,
+            limit=limit,
+            reverse=reverse,
+            max_in_memory=max_in_memory,
+        )
     else:
         # wrap_unsorted may be used here if the user specified an order_key,
         # or manually passed a order_value function
@@ -396,6 +543,7 @@ Specify a type or a key to order the value by""")
             drop_unsorted=drop_unsorted,
             limit=limit,
             reverse=reverse,
+            max_in_memory=max_in_memory,
         )
     return itr
 
@@ -460,6 +608,132 @@ def test_filter_in_timeframe() -> None:
     assert using_range == normal
 
 
+def test_range_with_limit() -> None:
+    rng = RangeTuple(after=None, before=str(datetime(year=2016, month=1, day=1)), within=None)
+
+    # most recent items before 2016
+    res = list(
+        select_range(
+            _mixed_iter_errors(),
+            order_by_value_type=datetime,
+            unparsed_range=rng,
+            drop_exceptions=True,
+            reverse=True,
+            limit=2,
+        )
+    )
+    assert res == [
+        _B(y=datetime(year=2015, month=5, day=10, hour=4, minute=10, second=1)),
+        _A(x=datetime(2009, 5, 10, 4, 10, 1), y=5, z=10),
+    ]
+
+
+def test_range_presorted() -> None:
+    from .query import _Int
+
+    consumed = 0
+
+    def src() -> Iterator[ET[_Int]]:
+        nonlocal consumed
+        for i in range(100):
+            consumed += 1
+            if i == 5:
+                yield RuntimeError('whoops')
+            yield _Int(i)
+
+    rng = RangeTuple(after='10', before='20', within=None)
+    by_x = lambda o: None if isinstance(o, Exception) else o.x
+    expected = [_Int(i) for i in range(10, 20)]
+
+    res = list(select_range(src(), order_by=by_x, order_by_value_type=int, unparsed_range=rng, presorted=True))
+    assert res == expected
+    # stopped at the first item past the range
+    assert consumed == 21
+
+    consumed = 0
+    res = list(select_range(src(), order_by=by_x, order_by_value_type=int, unparsed_range=rng, presorted=True, limit=3))
+    assert res == expected[:3]
+    assert consumed == 13
+
+    consumed = 0
+    res = list(
+        select_range(src(), order_by=by_x, order_by_value_type=int, unparsed_range=rng, presorted=True, reverse=True)
+    )
+    assert res == expected[::-1]
+    assert consumed == 21
+
+    # same results without presorted, but consumes everything
+    consumed = 0
+    res = list(select_range(src(), order_by=by_x, order_by_value_type=int, unparsed_range=rng))
+    assert res == expected
+    assert consumed == 100
+
+
+def test_range_presorted_sequence() -> None:
+    from .query import _Int
+
+    items: list[ET[_Int]] = [_Int(i // 2) for i in range(1000)]
+    # errors/unsortable items can be anywhere
+    items[0:0] = [RuntimeError('start')]
+    items[500:500] = [RuntimeError('middle'), RuntimeError('middle')]
+    items.append(RuntimeError('end'))
+
+    calls = 0
+
+    def by_x(o: ET[_Int]) -> int | None:
+        nonlocal calls
+        calls += 1
+        return None if isinstance(o, Exception) else o.x
+
+    for rng in [
+        RangeTuple(after='100', before='300', within=None),
+        RangeTuple(after='248', before='252', within=None),
+        RangeTuple(after=None, before='5', within=None),
+        RangeTuple(after='450', before=None, within=None),
+        RangeTuple(after='2000', before=None, within=None),
+    ]:
+        for reverse in [False, True]:
+            kwargs: dict[str, Any] = {
+                'order_by': by_x,
+                'order_by_value_type': int,
+                'unparsed_range': rng,
+                'reverse': reverse,
+            }
+            expected = list(select_range(iter(items), **kwargs))
+            calls = 0
+            res = list(select_range(items, presorted=True, **kwargs))
+            assert res == expected
+            # binary search + the items in the range
+            assert calls < 100 + 4 * len(expected)
+
+    # where is still applied
+    rng = RangeTuple(after='100', before='110', within=None)
+    even = lambda o: o.x % 2 == 0
+    res = list(
+        select_range(items, where=even, order_by=by_x, order_by_value_type=int, unparsed_range=rng, presorted=True)
+    )
+    assert res == [_Int(x) for x in [100, 100, 102, 102, 104, 104, 106, 106, 108, 108]]
+
+    # same results for a sequence and an iterator, with exceptions in the range
+    rng = RangeTuple(after='240', before='260', within=None)
+    for where, drop_exceptions in [
+        (lambda o: isinstance(o, Exception) or o.x % 2 == 0, False),
+        # where shouldn't see the exceptions if they're dropped
+        (even, True),
+    ]:
+        kwargs = {
+            'where': where,
+            'drop_exceptions': drop_exceptions,
+            'order_by': by_x,
+            'order_by_value_type': int,
+            'unparsed_range': rng,
+            'presorted': True,
+        }
+        from_iter = list(select_range(iter(items), **kwargs))
+        from_seq = list(select_range(items, **kwargs))
+        assert from_seq == from_iter == [_Int(x) for x in range(240, 260, 2) for _ in range(2)]
+
+
 def test_query_range_float_value_type() -> None:
 
     def floaty_iter() -> Iterator[_Float]:
@@ -537,6 +811,23 @@ def test_parse_range() -> None:
     assert res3 is None
 
 
+def test_datetime_range_hint() -> None:
+    start = datetime(2020, 1, 1, tzinfo=UTC)
+    end = datetime(2020, 1, 8, tzinfo=UTC)
+
+    assert datetime_range_hint(RangeTuple(None, None, None)) == (None, None)
+    assert datetime_range_hint(RangeTuple(start.isoformat(), end.isoformat(), None)) == (start, end)
+    assert datetime_range_hint(RangeTuple(start.isoformat(), None, "1w")) == (start, end)
+    assert datetime_range_hint(RangeTuple(None, end.isoformat(), "1w")) == (start, end)
+    assert datetime_range_hint(RangeTuple(None, end.isoformat(), None)) == (None, end)
+
+    # relative to 'now' -- leaves the upper end unbounded
+    since, until = datetime_range_hint(RangeTuple(None, None, "1d"))
+    assert since is not None
+    assert abs((datetime.now(tz=UTC) - timedelta(days=1) - since).total_seconds()) < 60
+    assert until is None
+
+
 def test_parse_timedelta_string() -> None:
 
     import pytest
@@ -2,8 +2,10 @@ from __future__ import annotations
 
 import shutil
 import sqlite3
-from collections.abc import Callable, Iterator
+from collections import defaultdict
+from collections.abc import Callable, Iterable, Iterator
 from contextlib import contextmanager
+from hashlib import blake2b
 from pathlib import Path
 from tempfile import TemporaryDirectory
 from typing import Any, Literal, assert_never, overload
@@ -115,6 +117,52 @@ def sqlite_copy_and_open(db: Path | str) -> sqlite3.Connection:
     return dest
 
 
+class SnapshotDelta:
+    """
+    Helper for processing a series of snapshots of the same database (e.g. daily backups of an app's database)
+
+    Most rows in the consecutive snapshots are exactly the same, so instead of turning each of them into
+    an object and relying on unique_everseen to drop duplicates later, rows seen in earlier snapshots can be skipped straight away.
+    Only digests of the rows are kept (per table), so it's much cheaper than keeping the objects around.
+
+    NOTE: the row should contain everything the resulting object is computed from (e.g. primary key and all the columns used),
+    otherwise changes to the row in a later snapshot would be skipped
+    """
+
+    def __init__(self) -> None:
+        self.seen: defaultdict[str, set[bytes]] = defaultdict(set)
+
+    def is_new(self, table: str, row: Iterable[Any]) -> bool:
+        seen = self.seen[table]
+        # NOTE: not using hash(), 64 bits isn't enough to rule out collisions (which would silently drop rows)
+        h = blake2b(repr(tuple(row)).encode('utf8'), digest_size=16).digest()
+        if h in seen:
+            return False
+        seen.add(h)
+        return True
+
+    def new_rows[R: Iterable[Any]](self, table: str, rows: Iterable[R]) -> Iterator[R]:
+        for row in rows:
+            if self.is_new(table, row):
+                yield row
+
+
+def test_snapshot_delta(tmp_path: Path) -> None:
+    delta = SnapshotDelta()
+    res: list[tuple[Any, ...]] = []
+    for i, rows in enumerate([[(1, 'a'), (2, 'b')], [(1, 'a'), (2, 'B'), (3, 'c')], [(3, 'c')]]):
+        db = tmp_path / f'{i}.sqlite'
+        with sqlite_connection(db) as conn:
+            conn.execute('CREATE TABLE t (id INTEGER PRIMARY KEY, value TEXT)')
+            conn.executemany('INSERT INTO t VALUES (?, ?)', rows)
+        with sqlite_connection(db, immutable=True, row_factory='row') as conn:
+            res.extend(tuple(r) for r in delta.new_rows('t', conn.execute('SELECT id, value FROM t')))
+    assert res == [(1, 'a'), (2, 'b'), (2, 'B'), (3, 'c')]
+
+    # separate for each table
+    assert delta.is_new('other', (1, 'a'))
+
+
 # NOTE hmm, so this kinda works
 # V = TypeVar('V', bound=Tuple[Any, ...])
 # def select(cols: V, rest: str, *, db: sqlite3.Connection) -> Iterator[V]:
@@ -2,13 +2,16 @@ from __future__ import annotations
 
 import atexit
 import os
+import posixpath
 import shutil
 import tarfile
 import tempfile
 import zipfile
+from collections import defaultdict
 from collections.abc import Generator, Sequence
 from contextlib import contextmanager
 from pathlib import Path
+from typing import cast
 
 from .logging import make_logger
 
@@ -40,12 +43,49 @@ ZIP_EXT = {".zip"}
 TARGZ_EXT = {".tar.gz"}
 
 
+def _zip_matches(base: Path, expected: Sequence[str], *, partial: bool = False) -> list[Path]:
+    """
+    Same search as match_structure does for directories, but only using the zip's central directory (list of members),
+    so nothing has to be decompressed. Returns kompress.ZipPath objects
+    """
+    from kompress import ZipPath
+
+    zbase = ZipPath(base)
+    # NOTE: root is zipfile.CompleteDirs, so namelist() includes implied directories (ending with /) as well
+    names = set(zbase.root.namelist())
+    subdirs: defaultdict[str, list[str]] = defaultdict(list)
+    for name in sorted(names):
+        if name.endswith('/'):
+            parent = posixpath.dirname(name.rstrip('/'))
+            subdirs[parent + '/' if parent != '' else ''].append(name)
+
+    def exists(d: str, f: str) -> bool:
+        f = f.rstrip('/')
+        return d + f in names or d + f + '/' in names
+
+    start = zbase.at
+    if start != '' and not start.endswith('/'):
+        start += '/'
+
+    matches: list[Path] = []
+    possible_targets: list[str] = [start]
+    while len(possible_targets) > 0:
+        d = possible_targets.pop(0)
+        targets_exist = (exists(d, f) for f in expected)
+        if any(targets_exist) if partial else all(targets_exist):
+            matches.append(cast(Path, zbase if d == zbase.at else ZipPath(zbase.root, d)))
+        else:
+            possible_targets.extend(subdirs[d])
+    return matches
+
+
 @contextmanager
 def match_structure(
     base: Path,
     expected: str | Sequence[str],
     *,
     partial: bool = False,
+    use_zippath: bool = False,
 ) -> Generator[tuple[Path, ...], None, None]:
     """
     Given a 'base' directory or archive (zip/tar.gz), recursively search for one or more paths that match the
@@ -65,6 +105,11 @@ def match_structure(
     (configured by core_config.config.get_tmp_dir), and then searches the extracted
     folder for matching structures
 
+    If 'use_zippath' is True and base is a zip, nothing is extracted: the search only
+    uses the list of the archive members, and this returns kompress.ZipPath objects
+    instead, so only the files which are actually read get decompressed (on demand).
+    tar.gz archives don't support random access, so they are always extracted
+
     This returns the top of every matching folder structure it finds
 
     As an example:
@@ -114,6 +159,16 @@ def match_structure(
     is_zip: bool = base.suffix in ZIP_EXT
     is_targz: bool = any(base.name.endswith(suffix) for suffix in TARGZ_EXT)
 
+    if is_zip and use_zippath:
+        assert base.exists(), f"archive at {base} doesn't exist"
+        zmatches = _zip_matches(base, expected, partial=partial)
+        if len(zmatches) == 0:
+            logger.warning(
+                f"""While searching {base}, could not find a matching folder structure. Expected {expected}. You're probably missing required files in the gdpr/export"""
+            )
+        yield tuple(zmatches)
+        return
+
     searchdir: Path = base.absolute()
     try:
         # if the file given by the user is an archive, create a temporary
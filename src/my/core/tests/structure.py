@@ -26,6 +26,28 @@ def test_gdpr_unpack(archive: str) -> None:
     assert not extracted.exists()
 
 
+def test_gdpr_zippath() -> None:
+    from kompress import ZipPath
+
+    archive = structure_data / "gdpr_export.zip"
+    with match_structure(archive, expected=gdpr_expected, use_zippath=True) as results:
+        [extracted] = results
+        assert isinstance(extracted, ZipPath)
+        index_file = extracted / "messages" / "index.csv"
+        assert index_file.read_text().strip() == "test message"
+
+    # expected=() matches the archive itself
+    with match_structure(archive, expected=(), use_zippath=True) as results:
+        assert results == (ZipPath(archive),)
+
+    with match_structure(archive, expected=("missing",), use_zippath=True) as results:
+        assert results == ()
+
+    # partial match stops at the top directory
+    with match_structure(ZipPath(archive), expected=("profile", "missing"), partial=True, use_zippath=True) as results:
+        assert results == (ZipPath(archive) / "gdpr_export",)
+
+
 def test_match_partial() -> None:
     # a partial match should match both the 'broken' and 'gdpr_export' directories
     with match_structure(structure_data / "gdpr_subdirs", expected=gdpr_expected, partial=True) as results:
@@ -1,8 +1,14 @@
 from __future__ import annotations
 
-from collections.abc import Callable
+import os
+import queue
+import threading
+from collections import deque
+from collections.abc import Callable, Iterable, Iterator, Sequence
 from concurrent.futures import Executor, Future
-from typing import Any
+from typing import Any, NamedTuple
+
+from ..error import Res
 
 
 # https://stackoverflow.com/a/10436851/706389
@@ -34,3 +40,215 @@ class DummyExecutor(Executor):
 
     def shutdown(self, wait: bool = True, **kwargs) -> None:  # noqa: FBT001,FBT002,ARG002
         self._shutdown = True
+
+
+def cpu_executor() -> Executor:
+    """
+    The process pool managed by HPI (see my.core._cpu_pool), or DummyExecutor
+    (i.e. runs everything serially) if it's not enabled
+
+    Shouldn't be shut down, since it's shared
+    """
+    from .._cpu_pool import get_cpu_pool
+
+    pool = get_cpu_pool()
+    return DummyExecutor() if pool is None else pool
+
+
+def executor_workers(executor: Executor) -> int:
+    """
+    How many tasks the executor runs at the same time, e.g. to decide how many results to prefetch
+    """
+    if isinstance(executor, DummyExecutor):
+        return 1
+    # NOTE: _max_workers is private, but both ProcessPoolExecutor and ThreadPoolExecutor have it
+    workers: int | None = getattr(executor, '_max_workers', None)
+    if workers is None:
+        return os.cpu_count() or 1
+    return workers
+
+
+def test_executor_workers() -> None:
+    from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+    assert executor_workers(DummyExecutor()) == 1
+    assert executor_workers(DummyExecutor(max_workers=4)) == 1
+    with ProcessPoolExecutor(2) as ppool:
+        assert executor_workers(ppool) == 2
+    with ThreadPoolExecutor(3) as tpool:
+        assert executor_workers(tpool) == 3
+
+
+def parallel_map[R](
+    func: Callable[..., R],
+    *iterables: Iterable[Any],
+    executor: Executor | None = None,
+    prefetch: int = 64,
+) -> Iterator[Res[R]]:
+    """
+    Like Executor.map, but
+    - uses cpu_executor() by default
+    - streams the results (in the same order as the inputs), only running
+      up to 'prefetch' items ahead of the consumer, so the inputs can be lazy
+    - if func raises for some item, yields the exception instead of stopping
+
+    func and the arguments have to be picklable when running in a process pool
+    """
+    if executor is None:
+        executor = cpu_executor()
+    pending: deque[Future[R]] = deque()
+
+    def result(f: Future[R]) -> Res[R]:
+        try:
+            return f.result()
+        except Exception as e:
+            return e
+
+    for args in zip(*iterables, strict=True):
+        pending.append(executor.submit(func, *args))
+        if len(pending) > prefetch:
+            yield result(pending.popleft())
+    while len(pending) > 0:
+        yield result(pending.popleft())
+
+
+class _Raised(NamedTuple):
+    # exception raised by one of the functions (as opposed to returned as a value)
+    exc: BaseException
+
+
+_DONE = object()
+
+
+def iterate_parallel[T](
+    funcs: Sequence[Callable[[], Iterable[T]]],
+    *,
+    max_queued: int = 10_000,
+    batch_size: int = 100,
+) -> Iterator[T]:
+    """
+    Runs each function in its own thread, yielding items as they are produced
+    (so items from different functions are interleaved)
+
+    At most max_queued items are buffered, if the consumer is slower the threads wait.
+    Items are passed in batches, to reduce the synchronization overhead.
+    If a function raises, the exception is reraised here, once the items before it are consumed
+
+    Threads mostly help with IO (reading files, sqlite, parsing in C extensions)
+    -- for CPU heavy work providers should use my.core._cpu_pool
+    """
+    if len(funcs) == 0:
+        return
+    q: queue.Queue[Any] = queue.Queue(maxsize=max(1, max_queued // batch_size))
+    stop = threading.Event()
+
+    def put(x: Any) -> bool:
+        while not stop.is_set():
+            try:
+                q.put(x, timeout=0.1)
+            except queue.Full:
+                continue
+            else:
+                return True
+        return False
+
+    def worker(func: Callable[[], Iterable[T]]) -> None:
+        try:
+            batch: list[T] = []
+            for item in func():
+                batch.append(item)
+                if len(batch) >= batch_size:
+                    if not put(batch):
+                        return
+                    batch = []
+            if len(batch) > 0:
+                put(batch)
+        except BaseException as e:
+            put(_Raised(e))
+        finally:
+            put(_DONE)
+
+    # daemon, so if the consumer stops early, a thread busy inside a function doesn't block exiting
+    for func in funcs:
+        threading.Thread(target=worker, args=(func,), daemon=True).start()
+
+    try:
+        running = len(funcs)
+        while running > 0:
+            x = q.get()
+            if x is _DONE:
+                running -= 1
+            elif isinstance(x, _Raised):
+                raise x.exc
+            else:
+                yield from x
+    finally:
+        stop.set()
+
+
+def _square(x: int) -> int:
+    if x == 3:
+        raise RuntimeError('whoops')
+    return x * x
+
+
+def test_parallel_map() -> None:
+    from concurrent.futures import ProcessPoolExecutor
+
+    expected = [0, 1, 4, 'whoops', 16]
+
+    def check(res: Iterable[Res[int]]) -> None:
+        assert [str(r) if isinstance(r, Exception) else r for r in res] == expected
+
+    # no HPI_CPU_POOL -- runs serially
+    check(parallel_map(_square, range(5)))
+    check(parallel_map(_square, range(5), prefetch=1))
+    with ProcessPoolExecutor(2) as pool:
+        check(parallel_map(_square, range(5), executor=pool, prefetch=2))
+
+    # multiple iterables, like Executor.map
+    assert list(parallel_map(pow, [2, 3], [3, 2])) == [8, 9]
+
+    # inputs are consumed lazily
+    consumed = 0
+
+    def inputs() -> Iterator[int]:
+        nonlocal consumed
+        for i in range(100):
+            consumed += 1
+            yield i
+
+    it = parallel_map(_square, inputs(), prefetch=5)
+    assert next(it) == 0
+    assert consumed <= 7
+
+
+def test_iterate_parallel() -> None:
+    import pytest
+
+    def src(start: int) -> Callable[[], Iterator[int]]:
+        def func() -> Iterator[int]:
+            yield from range(start, start + 1000)
+
+        return func
+
+    res = list(iterate_parallel([src(0), src(1000), src(2000)], max_queued=50, batch_size=7))
+    assert sorted(res) == list(range(3000))
+    # order within each function is preserved
+    assert [x for x in res if x < 1000] == list(range(1000))
+
+    assert list(iterate_parallel([])) == []
+
+    def fails() -> Iterator[int]:
+        yield 1
+        raise RuntimeError('whoops')
+
+    with pytest.raises(RuntimeError, match='whoops'):
+        list(iterate_parallel([src(0), fails]))
+
+    # stopping early shouldn't hang
+    from itertools import islice
+
+    it = iterate_parallel([src(0), src(1000)], max_queued=10, batch_size=1)
+    assert len(list(islice(it, 5))) == 5
+    del it  # runs the generator's finally, stopping the threads
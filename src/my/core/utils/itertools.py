@@ -6,9 +6,18 @@ Ideally this should be as small as possible and we should rely on stdlib itertoo
 
 from __future__ import annotations
 
+import hashlib
+import heapq
+import itertools
+import pickle
+import sqlite3
+import tempfile
 import warnings
+from collections import deque
 from collections.abc import Callable, Hashable, Iterable, Iterator, Sized
-from typing import TYPE_CHECKING, cast
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Literal, cast
 
 import more_itertools
 from decorator import decorator
@@ -302,20 +311,107 @@ def test_check_if_hashable() -> None:
         check_if_hashable(x7)  # ty: ignore[invalid-argument-type]
 
 
+# - set   : keeps the keys themselves in memory (same as more_itertools.unique_everseen)
+# - digest: keeps 16-byte digests of the keys in memory
+# - sqlite: keeps 16-byte digests of the keys in a temporary sqlite database, for very large streams
+type UniqueBackend = Literal['set', 'digest', 'sqlite']
+
+
+def _key_digest(k: Any) -> bytes:
+    # NOTE: relies on repr, so the key's repr should identify it (true for str/tuples/dataclasses/NamedTuples etc.)
+    return hashlib.blake2b(repr(k).encode('utf8'), digest_size=16).digest()
+
+
+def _unique_everseen_sqlite[UET](iterable: Iterable[UET], *, key: Callable[[UET], Any] | None) -> Iterator[UET]:
+    from .. import core_config as CC
+
+    with tempfile.TemporaryDirectory(dir=CC.config.get_tmp_dir(), prefix='unique_everseen') as td:
+        conn = sqlite3.connect(Path(td) / 'seen.sqlite')
+        try:
+            # it's a throwaway database, so no need for durability
+            conn.execute('PRAGMA journal_mode=OFF')
+            conn.execute('PRAGMA synchronous=OFF')
+            conn.execute('CREATE TABLE seen (key BLOB PRIMARY KEY) WITHOUT ROWID')
+            for x in iterable:
+                k = x if key is None else key(x)
+                if isinstance(k, Exception):
+                    # exceptions are hashed by identity, so would never be deduplicated by the default backend either
+                    yield x
+                    continue
+                if conn.execute('INSERT OR IGNORE INTO seen VALUES (?)', (_key_digest(k),)).rowcount == 1:
+                    yield x
+        finally:
+            conn.close()
+
+
+def _unique_everseen_bounded[UET](
+    iterable: Iterable[UET],
+    *,
+    key: Callable[[UET], Any] | None,
+    digest: bool,
+    window: tuple[Callable[[UET], datetime], timedelta] | None,
+) -> Iterator[UET]:
+    seen: set[Any] = set()
+    # for time window mode: (dt, key) in order they were added, so we can forget the old ones
+    recent: deque[tuple[datetime, Any]] = deque()
+    latest: datetime | None = None
+    for x in iterable:
+        k = x if key is None else key(x)
+        if isinstance(k, Exception):
+            # exceptions are hashed by identity, so would never be deduplicated by the default backend either
+            yield x
+            continue
+        if digest:
+            k = _key_digest(k)
+
+        if window is not None and not isinstance(x, Exception):
+            (get_dt, delta) = window
+            dt = get_dt(x)
+            if latest is None or dt > latest:
+                latest = dt
+            while len(recent) > 0 and recent[0][0] < latest - delta:
+                (_, old) = recent.popleft()
+                seen.discard(old)
+            if k not in seen:
+                recent.append((dt, k))
+
+        if k in seen:
+            continue
+        seen.add(k)
+        yield x
+
+
 # NOTE: for historic reasons, this function had to accept Callable that returns iterator
 #        instead of just iterator
 #       TODO maybe deprecated Callable support? not sure
 def unique_everseen[UET, UEU](
     fun: Callable[[], Iterable[UET]] | Iterable[UET],
     key: Callable[[UET], UEU] | None = None,
+    *,
+    backend: UniqueBackend = 'set',
+    window: tuple[Callable[[UET], datetime], timedelta] | None = None,
 ) -> Iterator[UET]:
+    """
+    Same as more_itertools.unique_everseen, but with an option to bound the memory used to keep track of the seen keys
+
+    backend: see UniqueBackend. With 'digest' and 'sqlite', the keys are compared via digests of their repr
+    window: (dt getter, window size) for streams that are roughly sorted by dt.
+            Keys of items that are older than the latest item by more than the window are forgotten,
+            so their duplicates might be emitted again. Not supported for 'sqlite' backend.
+    """
     iterable: Iterable[UET]
     if callable(fun):
         iterable = fun()  # ty: ignore[call-top-callable,invalid-assignment]
     else:
         iterable = fun
 
-    return more_itertools.unique_everseen(iterable=iterable, key=key)
+    if backend == 'sqlite':
+        if window is not None:
+            raise ValueError("window isn't supported for 'sqlite' backend")
+        return _unique_everseen_sqlite(iterable, key=key)
+    if backend == 'set' and window is None:
+        return more_itertools.unique_everseen(iterable=iterable, key=key)
+    return _unique_everseen_bounded(iterable, key=key, digest=backend == 'digest', window=window)
 
 
 def test_unique_everseen() -> None:
@@ -335,3 +431,136 @@ def test_unique_everseen() -> None:
 
     good_list = [4, 3, 2, 1, 2, 3, 4]
     assert list(unique_everseen(good_list)) == [4, 3, 2, 1]
+
+
+def test_unique_everseen_backends(tmp_path: Path) -> None:
+    from .. import core_config as CC
+
+    items: list[Any] = [(1, 'a'), (2, 'b'), (1, 'a'), RuntimeError('x'), (3, 'c'), (2, 'b'), RuntimeError('x')]
+    backends: list[UniqueBackend] = ['set', 'digest', 'sqlite']
+    for backend in backends:
+        with CC._reset_config() as cc:
+            cc.tmp_dir = tmp_path
+            res = list(unique_everseen(items, backend=backend))
+            # errors aren't deduplicated
+            assert res == [(1, 'a'), (2, 'b'), items[3], (3, 'c'), items[6]]
+
+            assert list(unique_everseen(items[:3], key=lambda x: x[0], backend=backend)) == [(1, 'a'), (2, 'b')]
+
+        # temporary database is cleaned up
+        assert list(tmp_path.iterdir()) == []
+
+
+def test_unique_everseen_window() -> None:
+    import pytest
+
+    base = datetime(2020, 1, 1)
+    items = [(base + timedelta(minutes=m), v) for (m, v) in [(0, 'a'), (1, 'b'), (0, 'a'), (2, 'c'), (10, 'd'), (0, 'a'), (9, 'd')]]  # fmt: skip
+    window = (lambda x: x[0], timedelta(minutes=5))
+    backends: list[UniqueBackend] = ['set', 'digest']
+    for backend in backends:
+        res = list(unique_everseen(items, key=lambda x: x[1], backend=backend, window=window))
+        # by the time 'a' is seen for the third time, it's out of the window, so it's emitted again
+        assert [v for (_, v) in res] == ['a', 'b', 'c', 'd', 'a']
+
+    with pytest.raises(ValueError, match='window'):
+        list(unique_everseen(items, backend='sqlite', window=window))
+
+
+# max number of sorted runs merged at once, to avoid running out of file descriptors
+_EXTERNAL_SORT_FANIN = 128
+
+
+def _write_run(path: Path, items: Iterable) -> None:
+    with path.open('wb') as fo:
+        pickler = pickle.Pickler(fo, protocol=pickle.HIGHEST_PROTOCOL)
+        for x in items:
+            pickler.dump(x)
+
+
+def _read_run(path: Path) -> Iterator:
+    with path.open('rb') as fo:
+        unpickler = pickle.Unpickler(fo)
+        while True:
+            try:
+                yield unpickler.load()
+            except EOFError:
+                return
+
+
+def external_sorted[T](
+    iterable: Iterable[T],
+    *,
+    key: Callable[[T], Any] | None = None,
+    reverse: bool = False,
+    chunk_size: int = 100_000,
+    tmp_dir: Path | None = None,
+) -> Iterator[T]:
+    """
+    Same as sorted(), but keeps at most chunk_size items in memory.
+
+    Each chunk is sorted in memory and spilled to a temporary file as a sorted run (items need to be picklable),
+    then the runs are lazily merged. If everything fits in a single chunk, nothing is written to disk.
+    Like sorted(), the result is stable.
+    """
+    chunks = more_itertools.chunked(iterable, chunk_size)
+
+    first: list[T] | None = next(chunks, None)
+    if first is None:
+        return
+    first.sort(key=key, reverse=reverse)  # ty: ignore[no-matching-overload]
+    second: list[T] | None = next(chunks, None)
+    if second is None:
+        # fits in memory, no need to spill
+        yield from first
+        return
+
+    if tmp_dir is None:
+        from .. import core_config as CC
+
+        tmp_dir = CC.config.get_tmp_dir()
+
+    with tempfile.TemporaryDirectory(dir=tmp_dir, prefix='external_sorted') as td:
+        runs: list[Path] = []
+        pending: list[list[T]] = [first, second]
+        del first, second  # so they can be garbage collected as soon as written
+        for chunk in itertools.chain(pending, chunks):
+            chunk.sort(key=key, reverse=reverse)  # ty: ignore[no-matching-overload]
+            run = Path(td) / f'{len(runs)}.pickle'
+            _write_run(run, chunk)
+            runs.append(run)
+            chunk.clear()
+        pending.clear()
+
+        # merge in multiple passes if there are too many runs
+        # note: merging consecutive groups of runs keeps the result stable
+        while len(runs) > _EXTERNAL_SORT_FANIN:
+            merged: list[Path] = []
+            for group in more_itertools.chunked(runs, _EXTERNAL_SORT_FANIN):
+                run = Path(td) / f'{len(runs) + len(merged)}.pickle'
+                _write_run(run, heapq.merge(*map(_read_run, group), key=key, reverse=reverse))
+                for g in group:
+                    g.unlink()
+                merged.append(run)
+            runs = merged
+
+        yield from heapq.merge(*map(_read_run, runs), key=key, reverse=reverse)
+
+
+def test_external_sorted(tmp_path: Path) -> None:
+    import random
+
+    items = [(random.randint(0, 100), i) for i in range(1000)]
+
+    key = lambda p: p[0]
+    for reverse in [False, True]:
+        expected = sorted(items, key=key, reverse=reverse)
+        # in memory
+        assert list(external_sorted(items, key=key, reverse=reverse, tmp_dir=tmp_path)) == expected
+        # spills to disk, multiple merge passes
+        res = external_sorted(iter(items), key=key, reverse=reverse, chunk_size=3, tmp_dir=tmp_path)
+        assert list(res) == expected
+
+    assert list(external_sorted([], tmp_dir=tmp_path)) == []
+    # temporary files are cleaned up
+    assert list(tmp_path.iterdir()) == []
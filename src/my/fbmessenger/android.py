@@ -14,7 +14,7 @@ from typing import Protocol, assert_never
 
 from my.core import Paths, Res, datetime_aware, get_files, make_logger
 from my.core.common import unique_everseen
-from my.core.sqlite import SqliteTool, sqlite_connection
+from my.core.sqlite import SnapshotDelta, SqliteTool, sqlite_connection
 
 logger = make_logger(__name__)
 
@@ -87,20 +87,41 @@ def _entities() -> Iterator[Res[Entity]]:
     paths = inputs()
     total = len(paths)
     width = len(str(total))
+    delta = SnapshotDelta()
     for idx, path in enumerate(paths):
         logger.info(f'processing [{idx:>{width}}/{total:>{width}}] {path}')
         with sqlite_connection(path, immutable=True, row_factory='row') as db:
             use_msys = "logging_events_v2" in SqliteTool(db).get_table_names()
             try:
                 if use_msys:
-                    yield from _process_db_msys(db)
+                    yield from _process_db_msys(db, delta=delta)
                 else:
-                    yield from _process_db_threads_db2(db)
+                    yield from _process_db_threads_db2(db, delta=delta)
             except Exception as e:
                 e.add_note(f'^ while processing {path}')
                 yield e
 
 
+def _replied_to_ids() -> set[str] | None:
+    """
+    Ids of the messages that other messages reply to
+
+    This way while resolving replies we only need to keep these in memory rather than every message.
+    Returns None if couldn't be determined (then all messages are kept).
+    """
+    res: set[str] = set()
+    for path in inputs():
+        try:
+            with sqlite_connection(path, immutable=True) as db:
+                use_msys = "logging_events_v2" in SqliteTool(db).get_table_names()
+                col = 'reply_source_id' if use_msys else 'message_replied_to_id'
+                res.update(mid for (mid,) in db.execute(f'SELECT DISTINCT {col} FROM messages WHERE {col} IS NOT NULL'))
+        except Exception as e:
+            logger.warning(f"couldn't get replied to messages from {path}, keeping all messages in memory: {e}")
+            return None
+    return res
+
+
 def _normalise_user_id(ukey: str) -> str:
     # trying to match messages.author from fbchat
     prefix = 'FACEBOOK:'
@@ -115,7 +136,7 @@ def _normalise_thread_id(key) -> str:
 
 # NOTE: this is sort of copy pasted from other _process_db method
 # maybe later could unify them
-def _process_db_msys(db: sqlite3.Connection) -> Iterator[Res[Entity]]:
+def _process_db_msys(db: sqlite3.Connection, *, delta: SnapshotDelta) -> Iterator[Res[Entity]]:
     config = make_config()  # meh... really need to think how to make it properly scoped
 
     senders: dict[str, Sender] = {}
@@ -170,7 +191,8 @@ def _process_db_msys(db: sqlite3.Connection) -> Iterator[Res[Entity]]:
 
     # TODO should be quicker to explicitly specify columns rather than SELECT *
     # should probably add it to module development tips?
-    for r in db.execute(
+    # most messages are the same across snapshots, so only process the ones we haven't seen yet
+    message_rows = db.execute(
         '''
     SELECT
       message_id,
@@ -191,7 +213,8 @@ def _process_db_msys(db: sqlite3.Connection) -> Iterator[Res[Entity]]:
         message_id != offline_threading_id
     ORDER BY timestamp_ms /* they aren't in order in the database, so need to sort */
         '''
-    ):
+    )
+    for r in delta.new_rows('messages', message_rows):
         yield _Message(
             id=r['message_id'],
             # TODO double check utc
@@ -204,7 +227,7 @@ def _process_db_msys(db: sqlite3.Connection) -> Iterator[Res[Entity]]:
         )
 
 
-def _process_db_threads_db2(db: sqlite3.Connection) -> Iterator[Res[Entity]]:
+def _process_db_threads_db2(db: sqlite3.Connection, *, delta: SnapshotDelta) -> Iterator[Res[Entity]]:
     config = make_config()  # meh... really need to think how to make it properly scoped
 
     senders: dict[str, Sender] = {}
@@ -249,7 +272,7 @@ def _process_db_threads_db2(db: sqlite3.Connection) -> Iterator[Res[Entity]]:
             name=name,
         )
 
-    for r in db.execute(
+    message_rows = db.execute(
         '''
     SELECT *, json_extract(sender, "$.user_key") AS user_key FROM messages
     WHERE msg_type NOT IN (
@@ -258,7 +281,8 @@ def _process_db_threads_db2(db: sqlite3.Connection) -> Iterator[Res[Entity]]:
     )
     ORDER BY timestamp_ms /* they aren't in order in the database, so need to sort */
         '''
-    ):
+    )
+    for r in delta.new_rows('messages', message_rows):
         yield _Message(
             id=r['msg_id'],
             # double checked against some messages in different timezone
@@ -272,16 +296,19 @@ def _process_db_threads_db2(db: sqlite3.Connection) -> Iterator[Res[Entity]]:
 
 
 def contacts() -> Iterator[Res[Sender]]:
-    for x in unique_everseen(_entities):
+    for x in unique_everseen(_entities, backend='digest'):
         if isinstance(x, (Sender, Exception)):
             yield x
 
 
 def messages() -> Iterator[Res[Message]]:
     senders: dict[str, Sender] = {}
+    # only keeping messages that are replied to, otherwise this grows with the whole message history
+    replied_to_ids = _replied_to_ids()
     msgs: dict[str, Message] = {}
     threads: dict[str, Thread] = {}
-    for x in unique_everseen(_entities):
+    # messages are the bulk of the data, so only keeping digests of seen entities in memory
+    for x in unique_everseen(_entities, backend='digest'):
         if isinstance(x, Exception):
             yield x
             continue
@@ -316,7 +343,8 @@ def messages() -> Iterator[Res[Message]]:
                 sender=sender,
                 reply_to=reply_to,
             )
-            msgs[m.id] = m
+            if replied_to_ids is None or m.id in replied_to_ids:
+                msgs[m.id] = m
             yield m
             continue
         # NOTE: for some reason mypy coverage highlights it as red?
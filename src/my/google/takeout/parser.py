@@ -9,25 +9,29 @@ exports in ~/.cache/google_takeout_parser
 
 The directory set as takeout_path can be unpacked directories, or
 zip files of the exports, which are temporarily unpacked while creating
-the cachew cache
+the cachew cache (or read in place, if _use_zippath is set)
 """
 
 REQUIRES = ["google-takeout-parser @ git+https://github.com/purarue/google_takeout_parser"]
 
+import json
 import os
-from collections.abc import Sequence
-from contextlib import ExitStack
+import uuid
+from collections.abc import Iterable, Iterator, Sequence
 from dataclasses import dataclass
+from functools import partial
 from pathlib import Path
-from typing import cast
 
 from google_takeout_parser.parse_html.html_time_utils import ABBR_TIMEZONES
+from kompress import ZipPath
 
-from my.core import Paths, Stats, get_files, make_config, make_logger, stat
+from my.core import Paths, Res, Stats, get_files, make_config, make_logger, stat
+from my.core._cpu_pool import get_cpu_pool
 from my.core.cachew import mcachew
 from my.core.error import ErrorPolicy
 from my.core.structure import match_structure
 from my.core.time import user_forced
+from my.core.utils.concurrent import executor_workers, parallel_map
 
 ABBR_TIMEZONES.extend(user_forced())
 
@@ -47,8 +51,8 @@ class google(user_config):
 
     error_policy: ErrorPolicy = 'yield'
 
-    # experimental flag to use kompress.ZipPath
-    # instead of unpacking to a tmp dir via match_structure
+    # experimental flag to read zipped takeouts in place via kompress.ZipPath
+    # instead of unpacking to a tmp dir (see match_structure(use_zippath=True))
     _use_zippath: bool = False
 
 
@@ -88,6 +92,7 @@ except ImportError:
 google_takeout_version = str(getattr(google_takeout_parser, '__version__', 'unknown'))
 
 
+# NOTE: not used here anymore, but downstream modules (e.g. my.location.google_takeout) cache on it
 def _cachew_depends_on() -> list[str]:
     exports = sorted([str(p) for p in inputs()])
     # add google takeout parser pip version to hash, so this re-creates on breaking changes
@@ -95,9 +100,127 @@ def _cachew_depends_on() -> list[str]:
     return exports
 
 
+def _takeout_key(path: Path) -> str:
+    # add google takeout parser pip version to the key, so this re-creates on breaking changes
+    return f"google_takeout_version: {google_takeout_version}: {path}"
+
+
+def _takeout_events(path: Path, *, disable_takeout_cache: bool) -> Iterator[Res[BaseEvent]]:
+    # for later takeouts it's just 'Takeout' dir,
+    # but for older (pre 2015) it contains email/date in the subdir name
+    with match_structure(path, expected=EXPECTED, partial=True, use_zippath=config._use_zippath) as results:
+        for m in results:
+            # e.g. /home/username/data/google_takeout/Takeout-1634932457.zip") -> 'Takeout-1634932457'
+            # means that zipped takeouts have nice filenames from cachew
+            cw_id, _, _ = path.name.rpartition(".")
+            # each takeout result is cached as well, in individual databases per-type
+            tk = TakeoutParser(m, cachew_identifier=cw_id, error_policy=config.error_policy)
+            # TODO might be nice to pass hpi cache dir?
+            yield from tk.parse(cache=not disable_takeout_cache)
+
+
+def _takeout_events_list(path: Path, *, disable_takeout_cache: bool) -> list[Res[BaseEvent]]:
+    # NOTE: module level function, so it can be pickled to run in a process pool
+    return list(_takeout_events(path, disable_takeout_cache=disable_takeout_cache))
+
+
+def _picklable(path: Path) -> Path:
+    # kompress.ZipPath keeps the zip file open, so can't be passed to worker processes
+    # match_structure handles plain paths to zips just as well
+    zpath: object = path
+    if isinstance(zpath, ZipPath) and zpath.at == '':
+        return zpath.filepath
+    return path
+
+
+def _parsed_takeouts(paths: Sequence[Path], *, disable_takeout_cache: bool) -> Iterator[Iterable[Res[BaseEvent]]]:
+    """
+    Events for each takeout, in the same order as paths
+
+    If HPI_CPU_POOL is set (see my.core._cpu_pool), takeouts are parsed in parallel in worker processes
+    (each one populates its own cache), otherwise they are parsed lazily one by one
+    """
+    pool = get_cpu_pool()
+    if pool is None:
+        for path in paths:
+            yield _takeout_events(path, disable_takeout_cache=disable_takeout_cache)
+        return
+
+    func = partial(_takeout_events_list, disable_takeout_cache=disable_takeout_cache)
+    # NOTE: parsed takeouts are kept in memory until they are merged, so only parse as many ahead as the pool runs at once
+    prefetch = executor_workers(pool)
+    for res in parallel_map(func, map(_picklable, paths), executor=pool, prefetch=prefetch):
+        if isinstance(res, Exception):
+            raise res
+        yield res
+
+
+# NOTE: sorts before the takeout keys, cachew relies on the keys being sorted
+_MERGE_MARKER = '!merge: '
+
+
+def _merge_state_path() -> Path | None:
+    from my.core import core_config as CC
+
+    cdir = CC.config.get_cache_dir()
+    if cdir is None:
+        return None
+    return cdir / 'my.google.takeout.parser' / 'merged_takeouts.json'
+
+
+def _merge_keys(takeouts: list[str]) -> list[str]:
+    """
+    cachew only checks the first synthetic key, and that the rest are after the last cached key
+    So it can't tell if a takeout was removed/replaced, or inserted before the last one
+
+    To detect that, the keys are remembered here, and they start with a marker, which changes
+    (forcing cachew to rebuild everything) unless the takeouts are the remembered ones, plus some appended
+    """
+    state_path = _merge_state_path()
+    if state_path is None:
+        # cache is disabled anyway
+        return [_MERGE_MARKER, *takeouts]
+
+    marker: str | None = None
+    try:
+        state = json.loads(state_path.read_text())
+    except (OSError, ValueError):
+        state = None
+    if isinstance(state, dict):
+        prev = state.get('takeouts')
+        if isinstance(prev, list) and prev == takeouts[: len(prev)]:
+            marker = state.get('marker')
+    if not isinstance(marker, str):
+        marker = f'{_MERGE_MARKER}{uuid.uuid4().hex}'
+        logger.debug(f"takeouts changed since the last merge (not just appended), rebuilding the cache ({state_path})")
+
+    # NOTE: saved before the cache is actually updated
+    # that's fine: cached keys are always a prefix of the saved ones if the marker is the same
+    try:
+        state_path.parent.mkdir(parents=True, exist_ok=True)
+        state_path.write_text(json.dumps({'marker': marker, 'takeouts': takeouts}))
+    except OSError as e:
+        # next time a new marker is picked, so the cache is just rebuilt
+        logger.warning(f"couldn't save merged takeouts to {state_path}: {e}")
+    return [marker, *takeouts]
+
+
 # ResultsType is a Union of all of the models in google_takeout_parser
-@mcachew(depends_on=_cachew_depends_on, logger=logger, force_file=True)
 def events(disable_takeout_cache: bool = DISABLE_TAKEOUT_CACHE) -> CacheResults:  # noqa: FBT001
+    takeouts = _merge_keys(sorted(map(_takeout_key, inputs())))
+    return _merged_events(takeouts=takeouts, disable_takeout_cache=disable_takeout_cache)
+
+
+# NOTE: synthetic_key makes the cache incremental -- if takeouts only got new (i.e. later) keys since the last run,
+# this gets the previously merged events as cachew_cached and only the new keys as takeouts
+# (see _merge_keys for the other changes, which rebuild the cache)
+@mcachew(logger=logger, force_file=True, synthetic_key='takeouts')
+def _merged_events(
+    *,
+    takeouts: Sequence[str],
+    disable_takeout_cache: bool,
+    cachew_cached: Iterable[Res[BaseEvent]] = (),
+) -> CacheResults:
     error_policy = config.error_policy
     count = 0
     emitted = GoogleEventSet()
@@ -112,38 +235,36 @@ def events(disable_takeout_cache: bool = DISABLE_TAKEOUT_CACHE) -> CacheResults:
             emitted.add(other)
             return True
 
+    by_key = {_takeout_key(p): p for p in inputs()}
     # reversed shouldn't really matter? but logic is to use newer
     # takeouts if they're named according to date, since JSON Activity
     # is nicer than HTML Activity
-    for path in reversed(inputs()):
-        with ExitStack() as exit_stack:
-            if config._use_zippath:
-                # for later takeouts it's just 'Takeout' dir,
-                # but for older (pre 2015) it contains email/date in the subdir name
-                results = tuple(cast(Sequence[Path], path.iterdir()))
-            else:
-                results = exit_stack.enter_context(match_structure(path, expected=EXPECTED, partial=True))
-            for m in results:
-                # e.g. /home/username/data/google_takeout/Takeout-1634932457.zip") -> 'Takeout-1634932457'
-                # means that zipped takeouts have nice filenames from cachew
-                cw_id, _, _ = path.name.rpartition(".")
-                # each takeout result is cached as well, in individual databases per-type
-                tk = TakeoutParser(m, cachew_identifier=cw_id, error_policy=error_policy)
-                # TODO might be nice to pass hpi cache dir?
-                for event in tk.parse(cache=not disable_takeout_cache):
-                    count += 1
-                    if isinstance(event, Exception):
-                        if error_policy == 'yield':
-                            yield event
-                        elif error_policy == 'raise':
-                            raise event
-                        elif error_policy == 'drop':
-                            pass
-                        continue
-
-                    if emitted_add(event):
-                        yield event  # type: ignore[misc]  # ty: ignore[invalid-yield]
-    logger.debug(f"HPI Takeout merge: from a total of {count} events, removed {count - len(emitted)} duplicates")
+    paths = [by_key[k] for k in reversed(takeouts) if not k.startswith(_MERGE_MARKER)]
+    for takeout_events in _parsed_takeouts(paths, disable_takeout_cache=disable_takeout_cache):
+        for event in takeout_events:
+            count += 1
+            if isinstance(event, Exception):
+                if error_policy == 'yield':
+                    yield event
+                elif error_policy == 'raise':
+                    raise event
+                elif error_policy == 'drop':
+                    pass
+                continue
+
+            if emitted_add(event):
+                yield event  # type: ignore[misc]  # ty: ignore[invalid-yield]
+
+    # previously merged events from older takeouts (only when the cache is updated incrementally)
+    # these are already deduplicated among themselves, so only need to drop the ones the newer takeouts had
+    cached = 0
+    for event in cachew_cached:
+        cached += 1
+        if isinstance(event, Exception) or event not in emitted:
+            yield event  # type: ignore[misc]  # ty: ignore[invalid-yield]
+    logger.debug(
+        f"HPI Takeout merge: from a total of {count} events, removed {count - len(emitted)} duplicates (merged with {cached} cached events)"
+    )
 
 
 def stats() -> Stats:
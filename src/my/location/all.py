@@ -2,22 +2,45 @@
 Merges location data from multiple sources
 """
 
-from collections.abc import Iterator
+import heapq
+from collections.abc import Callable, Iterator
 
 from my.core import Stats, make_logger
+from my.core.query import ordered_by
 from my.core.source import import_source
+from my.core.utils.itertools import external_sorted
 
 from .common import Location
 
 logger = make_logger(__name__, level="warning")
 
 
-def locations() -> Iterator[Location]:
+def _sources() -> Iterator[tuple[Callable[[], Iterator[Location]], bool]]:
     # can add/comment out sources here to disable them, or use core.disabled_modules
-    yield from _takeout_locations()
-    yield from _takeout_semantic_locations()
-    yield from _gpslogger_locations()
-    yield from _ip_locations()
+    # the flag specifies whether the source already yields locations in time order
+    yield _takeout_locations, False
+    yield _takeout_semantic_locations, False
+    yield _gpslogger_locations, False
+    yield _ip_locations, False
+
+
+@ordered_by('dt')
+def locations() -> Iterator[Location]:
+    for source, _is_sorted in _sources():
+        yield from source()
+
+
+@ordered_by('dt', is_sorted=True)
+def sorted_locations() -> Iterator[Location]:
+    """
+    Same as locations(), but in time order
+
+    Sources which yield in time order are merged lazily, the rest are sorted
+    first (spilling to disk if they are too large), so everything isn't kept in memory at once
+    """
+    by_dt = lambda l: l.dt
+    iterators = [source() if is_sorted else external_sorted(source(), key=by_dt) for source, is_sorted in _sources()]
+    yield from heapq.merge(*iterators, key=by_dt)
 
 
 @import_source(module_name="my.location.google_takeout")
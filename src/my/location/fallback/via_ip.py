@@ -6,10 +6,11 @@ REQUIRES = ["ipgeocache @ git+https://github.com/purarue/ipgeocache"]
 
 
 from bisect import bisect_left
-from collections.abc import Iterator
+from collections.abc import Iterable, Iterator
 from dataclasses import dataclass
 from datetime import timedelta
 from functools import lru_cache
+from typing import Self, cast
 
 from my.config import location
 from my.core import Stats, make_config, make_logger
@@ -66,33 +67,71 @@ def _sorted_fallback_locations() -> list[FallbackLocation]:
     return fl
 
 
-def estimate_location(dt: DateExact) -> Iterator[FallbackLocation]:
-    # logger.debug(f"Estimating location for: {dt}")
-    fl = _sorted_fallback_locations()
-    dt_ts = _datetime_timestamp(dt)
+@dataclass
+class _IntervalIndex:
+    """
+    Start/end timestamps of the sorted fallback locations, precomputed so lookups
+    don't have to call .timestamp() on every bisect probe
+    """
+
+    locs: list[FallbackLocation]
+    starts: list[float]
+    ends: list[float]
+    # longest location duration -- bounds how far back a containing interval can start
+    max_duration: float
+
+    @classmethod
+    def build(cls, locs: list[FallbackLocation]) -> Self:
+        starts = [l.dt.timestamp() for l in locs]
+        # loc.duration is filtered for in _sorted_fallback_locations
+        durations = [cast(float, l.duration) for l in locs]
+        ends = [s + d for s, d in zip(starts, durations, strict=True)]
+        return cls(locs=locs, starts=starts, ends=ends, max_duration=max(durations, default=0.0))
+
+    def first_candidate(self, ts: float, *, lo: int = 0) -> int:
+        """
+        index of the first location which could possibly contain ts
+        """
+        return bisect_left(self.starts, ts - self.max_duration, lo=lo)
+
+    def containing(self, ts: float, *, start: int) -> Iterator[FallbackLocation]:
+        starts, ends = self.starts, self.ends
+        idx = start
+        # no more locations could possibly contain ts once we passed it
+        while idx < len(starts) and starts[idx] <= ts:
+            if ts <= ends[idx]:
+                yield self.locs[idx]
+            idx += 1
 
-    # search to find the first possible location which contains dt (something that started up to
-    # config.for_duration ago, and ends after dt)
-    idx = bisect_left(fl, dt_ts - config.for_duration.total_seconds(), key=lambda l: l.dt.timestamp())
 
-    # all items are before the given dt
-    if idx == len(fl):
-        return
+@lru_cache(1)
+def _fallback_index() -> _IntervalIndex:
+    return _IntervalIndex.build(_sorted_fallback_locations())
 
-    # iterate through in sorted order, until we find a location that is after the given dt
-    while idx < len(fl):
-        loc = fl[idx]
-        start_time = loc.dt.timestamp()
-        # loc.duration is filtered for in _sorted_fallback_locations
-        end_time = start_time + loc.duration  # type: ignore[operator]  # ty: ignore[unsupported-operator]
-        if start_time <= dt_ts <= end_time:
-            # logger.debug(f"Found location for {dt}: {loc}")
-            yield loc
-        # no more locations could possibly contain dt
-        if start_time > dt_ts:
-            # logger.debug(f"Passed start time: {end_time} > {dt_ts} ({datetime.fromtimestamp(end_time)} > {datetime.fromtimestamp(dt_ts)})")
-            break
-        idx += 1
+
+def estimate_location(dt: DateExact) -> Iterator[FallbackLocation]:
+    index = _fallback_index()
+    dt_ts = _datetime_timestamp(dt)
+    yield from index.containing(dt_ts, start=index.first_candidate(dt_ts))
+
+
+def estimate_locations(dts: Iterable[DateExact]) -> Iterator[list[FallbackLocation]]:
+    """
+    Batch version of estimate_location: yields the list of matching locations for each dt.
+
+    If dts are sorted, this is a single merge-style pass over the index
+    (out of order dts still work, they just restart the search from the beginning).
+    """
+    index = _fallback_index()
+    lo = 0
+    prev_ts = float('-inf')
+    for dt in dts:
+        dt_ts = _datetime_timestamp(dt)
+        if dt_ts < prev_ts:
+            lo = 0
+        prev_ts = dt_ts
+        lo = index.first_candidate(dt_ts, lo=lo)
+        yield list(index.containing(dt_ts, start=lo))
 
 
 def stats() -> Stats:
@@ -8,8 +8,10 @@ REQUIRES = [
     'pdfannots',
 ]
 
+import re
 import time
 from collections.abc import Iterator, Sequence
+from concurrent.futures import Executor
 from datetime import datetime
 from pathlib import Path
 from typing import TYPE_CHECKING, NamedTuple, Protocol
@@ -110,36 +112,59 @@ def get_annots(p: Path) -> list[Annotation]:
     return [_as_annotation(raw=a, path=str(p)) for a in annots]
 
 
-def _hash_files(pdfs: Sequence[Path]):
-    # if mtime hasn't changed then the file hasn't changed either
-    return [(pdf, pdf.stat().st_mtime) for pdf in pdfs]
+def _sanitize(p: Path) -> str:
+    return re.sub(r'\W', '_', str(p))
 
 
-# TODO might make more sense to be more fine grained here, e.g. cache annotations for indifidual files
-@mcachew(depends_on=_hash_files)
+def _cachew_cache_path(pdf: Path, **_kwargs) -> Path | None:
+    from my.core import core_config as CC
+
+    cdir = CC.config.get_cache_dir()
+    if cdir is None:
+        return None
+    return cdir / 'my.pdfs' / _sanitize(pdf)
+
+
+def _cachew_depends_on(pdf: Path, **_kwargs):
+    st = pdf.stat()
+    return (pdf, st.st_mtime, st.st_size)
+
+
+# cached per file, so if some pdfs are added/changed only these are processed again
+@mcachew(
+    cache_path=_cachew_cache_path,
+    force_file=True,
+    depends_on=_cachew_depends_on,
+)
+def _file_annotations(pdf: Path, *, pool: Executor) -> Iterator[Res[Annotation]]:
+    try:
+        yield from pool.submit(get_annots, pdf).result()
+    except Exception as e:
+        e.add_note(f'^ while processing {pdf}')
+        logger.exception(e)
+        # todo add a comment that it can be ignored... or something like that
+        # TODO not sure if should attach pdf as well; it's a bit annoying to pass around?
+        # also really have to think about interaction with cachew...
+        yield e
+
+
+# NOTE: not cached as a whole, otherwise any changed pdf would rewrite the cache for the entire library
+# the per-file caches are cheap to chain over
 def _iter_annotations(pdfs: Sequence[Path]) -> Iterator[Res[Annotation]]:
     logger.info('processing %d pdfs', len(pdfs))
 
     # todo how to print to stdout synchronously?
-    # todo global config option not to use pools? useful for debugging..
-    from concurrent.futures import ProcessPoolExecutor
-
-    from my.core.utils.concurrent import DummyExecutor
-
-    workers = None  # use 0 for debugging
-    Pool = DummyExecutor if workers == 0 else ProcessPoolExecutor
-    with Pool(workers) as pool:
-        futures = [pool.submit(get_annots, pdf) for pdf in pdfs]
-        for f, pdf in zip(futures, pdfs, strict=True):
-            try:
-                yield from f.result()
-            except Exception as e:
-                e.add_note(f'^ while processing {pdf}')
-                logger.exception(e)
-                # todo add a comment that it can be ignored... or something like that
-                # TODO not sure if should attach pdf as well; it's a bit annoying to pass around?
-                # also really have to think about interaction with cachew...
-                yield e
+    from concurrent.futures import ThreadPoolExecutor
+
+    from my.core.utils.concurrent import cpu_executor
+
+    # uses HPI_CPU_POOL processes (or runs serially if it's not set)
+    pool = cpu_executor()
+    # per-file cache lookups run in threads, so only files which aren't cached
+    # end up in the process pool, and these are processed in parallel
+    with ThreadPoolExecutor() as lookups:
+        for annots in lookups.map(lambda pdf: list(_file_annotations(pdf, pool=pool)), pdfs):
+            yield from annots
 
 
 def annotations() -> Iterator[Res[Annotation]]:
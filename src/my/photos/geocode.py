@@ -0,0 +1,97 @@
+"""
+Persistent cache for geocoding place names (from geo.json files) into coordinates
+"""
+
+from __future__ import annotations
+
+from my.core import __NOT_HPI_MODULE__  # noqa: F401  # isort: skip
+
+import sqlite3
+from collections.abc import Callable
+from pathlib import Path
+
+from my.core import make_logger
+from my.core.sqlite import sqlite_connection
+
+logger = make_logger(__name__)
+
+# returns (lat, lon), or None if the name couldn't be resolved
+type Geocoder = Callable[[str], tuple[float, float] | None]
+
+
+def nominatim_geocoder(name: str) -> tuple[float, float] | None:
+    """
+    Default geocoder, uses OpenStreetMap Nominatim (requires network)
+    """
+    from geopy.geocoders import Nominatim  # type: ignore[import-not-found]  # ty: ignore[unresolved-import]
+
+    # NOTE: Nominatim requires a custom user agent https://operations.osmfoundation.org/policies/nominatim/
+    g = Nominatim(user_agent='HPI').geocode(name)
+    if g is None:
+        return None
+    return (g.latitude, g.longitude)
+
+
+class GeocodeCache:
+    """
+    Geocoded names are persisted in a sqlite database (if path isn't None), so
+    the geocoder is only called for names which weren't seen before
+
+    If geocoder is None, only uses the cache (i.e. runs offline)
+    """
+
+    def __init__(self, path: Path | None, *, geocoder: Geocoder | None) -> None:
+        self.path = path
+        self.geocoder = geocoder
+        self.cache: dict[str, tuple[float, float] | None] = {}
+        if path is not None and path.exists():
+            try:
+                with sqlite_connection(path) as db:
+                    for name, lat, lon in db.execute('SELECT name, lat, lon FROM geocode'):
+                        self.cache[name] = None if lat is None else (lat, lon)
+            except sqlite3.Error as e:
+                logger.warning(f"couldn't read geocode cache {path}, ignoring: {e}")
+
+    def geocode(self, name: str) -> tuple[float, float] | None:
+        if name in self.cache:
+            return self.cache[name]
+        if self.geocoder is None:
+            logger.warning(f"{name!r} isn't in the geocode cache and the geocoder is disabled, skipping")
+            return None
+        res = self.geocoder(name)
+        if res is None:
+            logger.warning(f"couldn't geocode {name!r}")
+        self.cache[name] = res
+        self._save(name, res)
+        return res
+
+    def _save(self, name: str, res: tuple[float, float] | None) -> None:
+        if self.path is None:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        (lat, lon) = (None, None) if res is None else res
+        with sqlite_connection(self.path) as db:
+            db.execute('CREATE TABLE IF NOT EXISTS geocode (name TEXT PRIMARY KEY, lat REAL, lon REAL)')
+            db.execute('INSERT OR REPLACE INTO geocode VALUES (?, ?, ?)', (name, lat, lon))
+
+
+def test_geocode_cache(tmp_path: Path) -> None:
+    calls: list[str] = []
+
+    def geocoder(name: str) -> tuple[float, float] | None:
+        calls.append(name)
+        return None if name == 'nowhere' else (1.0, 2.0)
+
+    path = tmp_path / 'geocode.sqlite'
+    cache = GeocodeCache(path, geocoder=geocoder)
+    assert cache.geocode('London') == (1.0, 2.0)
+    assert cache.geocode('London') == (1.0, 2.0)
+    assert cache.geocode('nowhere') is None
+    assert calls == ['London', 'nowhere']
+
+    # persisted, and works offline
+    offline = GeocodeCache(path, geocoder=None)
+    assert offline.geocode('London') == (1.0, 2.0)
+    assert offline.geocode('nowhere') is None
+    assert offline.geocode('Paris') is None
+    assert calls == ['London', 'nowhere']
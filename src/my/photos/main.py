@@ -11,18 +11,20 @@ REQUIRES = [
 # NOTE: also uses fdfind to search photos
 
 import json
+import sqlite3
 from collections.abc import Iterable, Iterator
-from concurrent.futures import ProcessPoolExecutor as Pool
 from datetime import datetime
 from pathlib import Path
 from typing import NamedTuple
 
-from geopy.geocoders import Nominatim  # type: ignore[import-not-found]  # ty: ignore[unresolved-import]
-
 from my.core import make_logger
 from my.core.cachew import cache_dir, mcachew
 from my.core.error import Res, sort_res_by
 from my.core.mime import fastermime
+from my.core.sqlite import sqlite_connection
+from my.core.utils.concurrent import parallel_map
+
+from .geocode import GeocodeCache, Geocoder, nominatim_geocoder
 
 from my.config import photos as config  # type: ignore[attr-defined]  # ty: ignore[unresolved-import] # isort: skip
 
@@ -63,39 +65,41 @@ from .utils import Exif, ExifTags, convert_ref, dt_from_path, get_exif_from_file
 Result = Res[Photo]
 
 
-def _make_photo_aux(*args, **kwargs) -> list[Result]:
-    # for the process pool..
-    return list(_make_photo(*args, **kwargs))
+class _ExifInfo(NamedTuple):
+    # raw DateTimeOriginal
+    dt: str | None
+    geo: LatLon | None
 
 
-def _make_photo(photo: Path, mtype: str, *, parent_geo: LatLon | None) -> Iterator[Result]:
-    exif: Exif
-    if any(x in mtype for x in ['image/png', 'image/x-ms-bmp', 'video']):
-        # TODO don't remember why..
-        logger.debug(f"skipping exif extraction for {photo} due to mime {mtype}")
-        exif = {}
-    else:
-        try:
-            exif = get_exif_from_file(photo)
-        except Exception as e:
-            # TODO add exception note?
-            yield e
-            exif = {}
+def _skip_exif(mtype: str) -> bool:
+    # TODO don't remember why..
+    return any(x in mtype for x in ['image/png', 'image/x-ms-bmp', 'video'])
+
+
+def _extract_exif(photo: Path) -> _ExifInfo:
+    # runs in the process pool, so only extracts what we need from the exif
+    exif: Exif = get_exif_from_file(photo)
+    geo: LatLon | None = None
+    meta = exif.get(ExifTags.GPSINFO, {})
+    if ExifTags.LAT in meta and ExifTags.LON in meta:
+        geo = LatLon(
+            lat=convert_ref(meta[ExifTags.LAT], meta[ExifTags.LAT_REF]),
+            lon=convert_ref(meta[ExifTags.LON], meta[ExifTags.LON_REF]),
+        )
+    return _ExifInfo(dt=exif.get(ExifTags.DATETIME), geo=geo)
+
 
+def _make_photo(photo: Path, *, exif: _ExifInfo | None, parent_geo: LatLon | None) -> Photo:
     def _get_geo() -> LatLon | None:
-        meta = exif.get(ExifTags.GPSINFO, {})
-        if ExifTags.LAT in meta and ExifTags.LON in meta:
-            return LatLon(
-                lat=convert_ref(meta[ExifTags.LAT], meta[ExifTags.LAT_REF]),
-                lon=convert_ref(meta[ExifTags.LON], meta[ExifTags.LON_REF]),
-            )
+        if exif is not None and exif.geo is not None:
+            return exif.geo
         return parent_geo
 
     # TODO aware on unaware?
     def _get_dt() -> datetime | None:
-        edt = exif.get(ExifTags.DATETIME)
-        if edt is not None:
-            dtimes = edt.replace(' 24', ' 00')  # jeez maybe log it?
+        exif_dt = None if exif is None else exif.dt
+        if exif_dt is not None:
+            dtimes = exif_dt.replace(' 24', ' 00')  # jeez maybe log it?
             if dtimes == "0000:00:00 00:00:00":
                 logger.warning(f"Bad exif timestamp {dtimes} for {photo}")
             else:
@@ -123,10 +127,91 @@ def _make_photo(photo: Path, mtype: str, *, parent_geo: LatLon | None) -> Iterat
     geo = _get_geo()
     dt = _get_dt()
 
-    yield Photo(str(photo), dt=dt, geo=geo)
+    return Photo(str(photo), dt=dt, geo=geo)
+
+
+class _ExifIndex:
+    """
+    Exif info for each photo, keyed on (path, size, mtime), persisted in the cache dir
+    So only new/changed photos need to be processed again
+
+    Errors aren't persisted (they might be transient), so these photos are processed again on the next run
+    """
+
+    def __init__(self, path: Path | None) -> None:
+        self.path = path
+        # path -> (size, mtime, dt, lat, lon)
+        self.rows: dict[str, tuple] = {}
+        self.updated: dict[str, tuple] = {}
+        self.failed: set[str] = set()
+        if path is not None and path.exists():
+            try:
+                with sqlite_connection(path) as db:
+                    for path_, *rest in db.execute('SELECT path, size, mtime, dt, lat, lon FROM exif'):
+                        self.rows[path_] = tuple(rest)
+            except sqlite3.Error as e:
+                logger.warning(f"couldn't read exif index {path}, ignoring: {e}")
+                self.rows = {}
+
+    @staticmethod
+    def key(photo: Path) -> tuple[int, float]:
+        st = photo.stat()
+        return (st.st_size, st.st_mtime)
+
+    def get(self, photo: Path, key: tuple[int, float]) -> _ExifInfo | None:
+        row = self.rows.get(str(photo))
+        if row is None or row[:2] != key:
+            return None
+        (_size, _mtime, dt, lat, lon) = row
+        return _ExifInfo(dt=dt, geo=None if lat is None else LatLon(lat=lat, lon=lon))
+
+    def put(self, photo: Path, key: tuple[int, float], info: Res[_ExifInfo]) -> None:
+        if isinstance(info, Exception):
+            # don't keep the previous row around either, it's for an older version of the file anyway
+            self.failed.add(str(photo))
+            return
+        geo = info.geo
+        self.updated[str(photo)] = (*key, info.dt, None if geo is None else geo.lat, None if geo is None else geo.lon)
+
+    def save(self, *, keep: set[str]) -> None:
+        if self.path is None:
+            return
+        stale = (self.rows.keys() - keep) | (self.rows.keys() & self.failed)
+        if len(self.updated) == 0 and len(stale) == 0:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with sqlite_connection(self.path) as db:
+            db.execute(
+                'CREATE TABLE IF NOT EXISTS exif (path TEXT PRIMARY KEY, size INTEGER, mtime REAL, dt TEXT, lat REAL, lon REAL)'
+            )
+            db.executemany('DELETE FROM exif WHERE path = ?', [(p,) for p in stale])
+            db.executemany(
+                'INSERT OR REPLACE INTO exif VALUES (?, ?, ?, ?, ?, ?)',
+                [(p, *row) for p, row in self.updated.items()],
+            )
+        logger.debug(f'exif index: updated {len(self.updated)}, removed {len(stale)}, failed {len(self.failed)}')
+
+
+def _cache_db_path(name: str) -> Path | None:
+    from my.core import core_config as CC
+
+    cdir = CC.config.get_cache_dir()
+    if cdir is None:
+        return None
+    return cdir / 'my.photos' / name
 
 
-def _candidates() -> Iterable[Res[str]]:
+def _geocoder() -> Geocoder | None:
+    # config.geocoder can be set to a custom callable (name -> (lat, lon) | None)
+    # or to None to only use previously cached names (e.g. to run offline)
+    return getattr(config, 'geocoder', nominatim_geocoder)
+
+
+def _geocode_cache() -> GeocodeCache:
+    return GeocodeCache(_cache_db_path('geocode.sqlite'), geocoder=_geocoder())
+
+
+def _candidates() -> Iterable[Res[tuple[str, str]]]:
     # TODO that could be a bit slow if there are to many extra files?
     from subprocess import PIPE, Popen
 
@@ -153,8 +238,7 @@ def _candidates() -> Iterable[Res[str]]:
                 msg = f'{path}: unexpected mime {tp}'
                 logger.warning(msg)
                 yield RuntimeError(msg)  # not sure if necessary
-            # TODO return mime too? so we don't have to call it again in _photos?
-            yield path
+            yield path, mime
 
 
 def photos() -> Iterator[Result]:
@@ -165,8 +249,8 @@ def photos() -> Iterator[Result]:
 # if geo information is missing from photo, you can specify it manually in geo.json file
 # TODO is there something more standard?
 @mcachew(cache_path=cache_dir())
-def _photos(candidates: Iterable[Res[str]]) -> Iterator[Result]:
-    geolocator = Nominatim()  # TODO does it cache??
+def _photos(candidates: Iterable[Res[tuple[str, str]]]) -> Iterator[Result]:
+    geocache = _geocode_cache()
 
     from functools import lru_cache
 
@@ -181,35 +265,70 @@ def _photos(candidates: Iterable[Res[str]]) -> Iterator[Result]:
 
         j = json.loads(geof.read_text())
         if 'name' in j:
-            g = geolocator.geocode(j['name'])
-            lat = g.latitude
-            lon = g.longitude
+            g = geocache.geocode(j['name'])
+            if g is None:
+                return None
+            (lat, lon) = g
         else:
             lat = j['lat']
             lon = j['lon']
         return LatLon(lat=lat, lon=lon)
 
-    pool = Pool()
-    futures = []
-
-    for p in candidates:
-        if isinstance(p, Exception):
-            yield p
+    todo: list[tuple[Path, str]] = []
+    for c in candidates:
+        if isinstance(c, Exception):
+            yield c
             continue
+        (p, mime) = c
         path = Path(p)
         # TODO rely on get_files
         if config.ignored(path):
             logger.info('ignoring %s due to config', path)
             continue
-
-        logger.debug('processing %s', path)
-        parent_geo = get_geo(path.parent)
-        mime = fastermime(str(path))
-
-        futures.append(pool.submit(_make_photo_aux, path, mime, parent_geo=parent_geo))
-
-    for f in futures:
-        yield from f.result()
+        todo.append((path, mime))
+
+    index = _ExifIndex(_cache_db_path('exif.sqlite'))
+
+    # figure out which photos weren't processed before (or changed since)
+    exifs: list[Res[_ExifInfo] | None] = []
+    keys: list[tuple[int, float] | None] = []
+    dirty: list[Path] = []
+    key: tuple[int, float] | None
+    for path, mime in todo:
+        if _skip_exif(mime):
+            logger.debug(f"skipping exif extraction for {path} due to mime {mime}")
+            exifs.append(None)
+            keys.append(None)
+            continue
+        try:
+            key = index.key(path)
+        except OSError as e:
+            exifs.append(e)
+            keys.append(None)
+            continue
+        cached = index.get(path, key)
+        if cached is None:
+            dirty.append(path)
+        exifs.append(cached)
+        keys.append(key)
+    logger.info(f'processing {len(dirty)} new/changed photos (out of {len(todo)})')
+
+    # runs in HPI_CPU_POOL processes (or serially if it's not set)
+    extracted = parallel_map(_extract_exif, dirty)
+    try:
+        for (path, _mime), exif, key in zip(todo, exifs, keys, strict=True):
+            if exif is None and key is not None:
+                exif = next(extracted)
+                index.put(path, key, exif)
+            if isinstance(exif, Exception):
+                # TODO add exception note?
+                yield exif
+                exif = None
+            logger.debug('processing %s', path)
+            yield _make_photo(path, exif=exif, parent_geo=get_geo(path.parent))
+    finally:
+        # keep whatever was processed, even if we didn't get to the end
+        index.save(keep={str(path) for path, _ in todo})
 
 
 def print_all() -> None:
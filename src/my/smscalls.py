@@ -25,14 +25,21 @@ from my.core.cfg import make_config
 
 config = make_config(smscalls)
 
-from collections.abc import Iterator
-from datetime import UTC, datetime
+import sqlite3
+from array import array
+from collections.abc import Iterator, Sequence
+from datetime import UTC, datetime, timedelta
+from hashlib import blake2b
 from pathlib import Path
 from typing import Any, NamedTuple
 
 import lxml.etree as etree
 
+from my.core import make_logger
 from my.core.error import Res
+from my.core.sqlite import sqlite_connection
+
+logger = make_logger(__name__)
 
 
 class Call(NamedTuple):
@@ -60,42 +67,232 @@ class Call(NamedTuple):
 UNKNOWN: set[str] = {'(Unknown)'}
 
 
-def _parse_xml(xml: Path) -> Any:
-    return etree.parse(str(xml), parser=etree.XMLParser(huge_tree=True))
+def _iterparse(xml: Path, tags: Sequence[str]) -> Iterator[Any]:
+    """
+    Yields top level elements with the given tags, clearing them after they are processed,
+    so the memory use doesn't grow with the size of the backup (MMS with attachments can be huge)
+    """
+    # NOTE: not using iterparse(tag=...), since then elements with other tags wouldn't be cleared
+    # (e.g. mms elements would all stay in memory while we're only after sms)
+    for _event, elem in etree.iterparse(str(xml), events=('end',), huge_tree=True):
+        parent = elem.getparent()
+        if parent is None:
+            # root element
+            continue
+        if parent.getparent() is not None:
+            # nested element (e.g. mms parts), processed/cleared along with its top level element
+            continue
+        if elem.tag in tags:
+            yield elem
+        elem.clear(keep_tail=True)
+        # also drop references to the elements processed previously (the parent keeps them otherwise)
+        while elem.getprevious() is not None:
+            del parent[0]
+
+
+def _backup_dt(path: Path) -> datetime | None:
+    # SMSBackupRestore names files like sms-20230101120000.xml, using local time
+    # (or custom names, in which case we can't tell)
+    try:
+        return datetime.strptime(path.stem.split('-', maxsplit=1)[-1], '%Y%m%d%H%M%S').replace(tzinfo=UTC)
+    except ValueError:
+        return None
 
 
-def _extract_calls(path: Path) -> Iterator[Res[Call]]:
-    tr = _parse_xml(path)
-    for cxml in tr.findall('call'):
-        dt = cxml.get('date')
-        dt_readable = cxml.get('readable_date')
-        duration = cxml.get('duration')
-        who = cxml.get('contact_name')
-        call_type = cxml.get('type')
-        number = cxml.get('number')
-        # if name is missing, its not None (its some string), depends on the phone/message app
-        if who is not None and who in UNKNOWN:
-            who = None
-        if dt is None or dt_readable is None or duration is None or call_type is None or number is None:
-            call_str = etree.tostring(cxml).decode('utf-8')
-            yield RuntimeError(
-                f"Missing one or more required attributes [date, readable_date, duration, type, number] in {call_str}"
-            )
+def _backups_since(files: Sequence[Path], since: datetime | None) -> Sequence[Path]:
+    """
+    A backup can't contain anything newer than the time it was made,
+    so if we only need items after 'since', can skip older backups
+    """
+    if since is None:
+        return files
+    # slack, since the filename is in local time
+    since = since - timedelta(days=1)
+    res = []
+    for p in files:
+        bdt = _backup_dt(p)
+        if bdt is not None and bdt < since:
             continue
-        # TODO we've got local tz here, not sure if useful..
-        # ok, so readable date is local datetime, changing throughout the backup
-        yield Call(
-            dt=_parse_dt_ms(dt),
-            dt_readable=dt_readable,
-            duration_s=int(duration),
-            phone_number=number,
-            who=who,
-            call_type=int(call_type),
+        res.append(p)
+    return res
+
+
+class _BackupSummary(NamedTuple):
+    min_dt: datetime | None
+    max_dt: datetime | None
+    items: int
+    # hash of all (distinct) items in the backup
+    fingerprint: str
+
+
+def _item_hash(item: Res[Any]) -> int:
+    # NOTE: hashing the whole item (not just the dedup key), so a backup is only skipped if the newer ones have exactly the same data
+    return int.from_bytes(blake2b(repr(item).encode('utf8'), digest_size=8).digest(), 'little')
+
+
+def _summarize(path: Path) -> tuple[_BackupSummary, array]:
+    hashes: set[int] = set()
+    dts: list[datetime] = []
+    for item in _extract_all(path):
+        hashes.add(_item_hash(item))
+        if not isinstance(item, Exception):
+            dts.append(item.dt)
+    harr = array('Q', sorted(hashes))
+    summary = _BackupSummary(
+        min_dt=min(dts, default=None),
+        max_dt=max(dts, default=None),
+        items=len(harr),
+        fingerprint=blake2b(harr.tobytes(), digest_size=16).hexdigest(),
+    )
+    return summary, harr
+
+
+def _backup_index_path() -> Path | None:
+    from my.core import core_config as CC
+
+    cdir = CC.config.get_cache_dir()
+    if cdir is None:
+        return None
+    return cdir / 'my.smscalls' / 'backups.sqlite'
+
+
+def _covering_backups(files: Sequence[Path]) -> Sequence[Path]:
+    """
+    Phone can make a full backup every night, so most of the backups are just a subset of the newer ones
+
+    Returns the backups which have to be parsed to get all the items: starting from the newest backup,
+    older ones are skipped if all of their items are present in the backups picked so far
+    (checking date ranges first, and then the actual item hashes)
+    If the ranges don't nest (e.g. messages were deleted from the phone), the backups are parsed as usual
+
+    The summaries are kept in an index in the cache dir, so each backup is only summarized once
+    NOTE: summarizing requires parsing the backup, so on the first run new backups are parsed twice
+    """
+    index_path = _backup_index_path()
+    if index_path is None or len(files) <= 1:
+        return files
+    try:
+        picked = _pick_covering(files, index_path)
+    except sqlite3.Error as e:
+        logger.warning(f"couldn't use backups index {index_path}, parsing all backups: {e}")
+        return files
+    logger.debug(f'parsing {len(picked)} backups out of {len(files)}, the rest are covered by them')
+    return picked
+
+
+def _pick_covering(files: Sequence[Path], index_path: Path) -> list[Path]:
+    index_path.parent.mkdir(parents=True, exist_ok=True)
+    with sqlite_connection(index_path) as db:
+        db.execute(
+            'CREATE TABLE IF NOT EXISTS backups '
+            '(path TEXT PRIMARY KEY, size INTEGER, mtime REAL, min_dt TEXT, max_dt TEXT, items INTEGER, fingerprint TEXT, hashes BLOB)'
         )
+        rows = {
+            path: (
+                (size, mtime),
+                _BackupSummary(
+                    min_dt=None if min_dt is None else datetime.fromisoformat(min_dt),
+                    max_dt=None if max_dt is None else datetime.fromisoformat(max_dt),
+                    items=items,
+                    fingerprint=fingerprint,
+                ),
+            )
+            for path, size, mtime, min_dt, max_dt, items, fingerprint in db.execute(
+                'SELECT path, size, mtime, min_dt, max_dt, items, fingerprint FROM backups'
+            )
+        }
+
+        def summary(f: Path) -> _BackupSummary:
+            st = f.stat()
+            key = (st.st_size, st.st_mtime)
+            row = rows.get(str(f))
+            if row is not None and row[0] == key:
+                return row[1]
+            logger.debug(f'summarizing {f}')
+            s, harr = _summarize(f)
+            db.execute(
+                'INSERT OR REPLACE INTO backups VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (
+                    str(f), *key,
+                    None if s.min_dt is None else s.min_dt.isoformat(),
+                    None if s.max_dt is None else s.max_dt.isoformat(),
+                    s.items, s.fingerprint, harr.tobytes(),
+                ),
+            )  # fmt: skip
+            return s
+
+        def hashes(f: Path) -> array:
+            [(blob,)] = db.execute('SELECT hashes FROM backups WHERE path = ?', (str(f),))
+            harr = array('Q')
+            harr.frombytes(blob)
+            return harr
+
+        picked: list[Path] = []
+        covered: set[int] = set()
+        fingerprints: set[str] = set()
+        lo: datetime | None = None
+        hi: datetime | None = None
+        for f in reversed(files):
+            s = summary(f)
+            if s.items == 0:
+                continue
+            assert s.min_dt is not None, s
+            assert s.max_dt is not None, s
+            if s.fingerprint in fingerprints:
+                continue  # exact duplicate of one of the picked backups
+            nested = lo is not None and hi is not None and lo <= s.min_dt and s.max_dt <= hi
+            if nested and covered.issuperset(hashes(f)):
+                continue
+            picked.append(f)
+            covered.update(hashes(f))
+            fingerprints.add(s.fingerprint)
+            lo = s.min_dt if lo is None else min(lo, s.min_dt)
+            hi = s.max_dt if hi is None else max(hi, s.max_dt)
+
+        stale = [p for p in rows if not Path(p).exists()]
+        db.executemany('DELETE FROM backups WHERE path = ?', [(p,) for p in stale])
+    return picked[::-1]
+
 
+def _backups(glob: str, *, since: datetime | None) -> Sequence[Path]:
+    return _covering_backups(_backups_since(get_files(config.export_path, glob=glob), since))
 
-def calls() -> Iterator[Res[Call]]:
-    files = get_files(config.export_path, glob='calls-*.xml')
+
+def _extract_calls(path: Path) -> Iterator[Res[Call]]:
+    for cxml in _iterparse(path, ['call']):
+        yield _parse_call(cxml)
+
+
+def _parse_call(cxml: Any) -> Res[Call]:
+    dt = cxml.get('date')
+    dt_readable = cxml.get('readable_date')
+    duration = cxml.get('duration')
+    who = cxml.get('contact_name')
+    call_type = cxml.get('type')
+    number = cxml.get('number')
+    # if name is missing, its not None (its some string), depends on the phone/message app
+    if who is not None and who in UNKNOWN:
+        who = None
+    if dt is None or dt_readable is None or duration is None or call_type is None or number is None:
+        call_str = etree.tostring(cxml).decode('utf-8')
+        return RuntimeError(
+            f"Missing one or more required attributes [date, readable_date, duration, type, number] in {call_str}"
+        )
+    # TODO we've got local tz here, not sure if useful..
+    # ok, so readable date is local datetime, changing throughout the backup
+    return Call(
+        dt=_parse_dt_ms(dt),
+        dt_readable=dt_readable,
+        duration_s=int(duration),
+        phone_number=number,
+        who=who,
+        call_type=int(call_type),
+    )
+
+
+def calls(*, since: datetime | None = None) -> Iterator[Res[Call]]:
+    # since is a hint (e.g. from hpi query), older items may still be returned
+    files = _backups('calls-*.xml', since=since)
 
     # TODO always replacing with the latter is good, we get better contact names??
     emitted: set[datetime] = set()
@@ -124,8 +321,9 @@ class Message(NamedTuple):
         return self.message_type == 2
 
 
-def messages() -> Iterator[Res[Message]]:
-    files = get_files(config.export_path, glob='sms-*.xml')
+def messages(*, since: datetime | None = None) -> Iterator[Res[Message]]:
+    # since is a hint (e.g. from hpi query), older items may still be returned
+    files = _backups('sms-*.xml', since=since)
 
     emitted: set[tuple[datetime, str | None, bool]] = set()
     for p in files:
@@ -141,31 +339,33 @@ def messages() -> Iterator[Res[Message]]:
 
 
 def _extract_messages(path: Path) -> Iterator[Res[Message]]:
-    tr = _parse_xml(path)
-    for mxml in tr.findall('sms'):
-        dt = mxml.get('date')
-        dt_readable = mxml.get('readable_date')
-        who = mxml.get('contact_name')
-        if who is not None and who in UNKNOWN:
-            who = None
-        message = mxml.get('body')
-        phone_number = mxml.get('address')
-        message_type = mxml.get('type')
-
-        if dt is None or dt_readable is None or message is None or phone_number is None or message_type is None:
-            msg_str = etree.tostring(mxml).decode('utf-8')
-            yield RuntimeError(
-                f"Missing one or more required attributes [date, readable_date, body, address, type] in {msg_str}"
-            )
-            continue
-        yield Message(
-            dt=_parse_dt_ms(dt),
-            dt_readable=dt_readable,
-            who=who,
-            message=message,
-            phone_number=phone_number,
-            message_type=int(message_type),
+    for mxml in _iterparse(path, ['sms']):
+        yield _parse_message(mxml)
+
+
+def _parse_message(mxml: Any) -> Res[Message]:
+    dt = mxml.get('date')
+    dt_readable = mxml.get('readable_date')
+    who = mxml.get('contact_name')
+    if who is not None and who in UNKNOWN:
+        who = None
+    message = mxml.get('body')
+    phone_number = mxml.get('address')
+    message_type = mxml.get('type')
+
+    if dt is None or dt_readable is None or message is None or phone_number is None or message_type is None:
+        msg_str = etree.tostring(mxml).decode('utf-8')
+        return RuntimeError(
+            f"Missing one or more required attributes [date, readable_date, body, address, type] in {msg_str}"
         )
+    return Message(
+        dt=_parse_dt_ms(dt),
+        dt_readable=dt_readable,
+        who=who,
+        message=message,
+        phone_number=phone_number,
+        message_type=int(message_type),
+    )
 
 
 class MMSContentPart(NamedTuple):
@@ -208,8 +408,9 @@ class MMS(NamedTuple):
         return self.message_type == 2
 
 
-def mms() -> Iterator[Res[MMS]]:
-    files = get_files(config.export_path, glob='sms-*.xml')
+def mms(*, since: datetime | None = None) -> Iterator[Res[MMS]]:
+    # since is a hint (e.g. from hpi query), older items may still be returned
+    files = _backups('sms-*.xml', since=since)
 
     emitted: set[tuple[datetime, str | None, str]] = set()
     for p in files:
@@ -224,6 +425,48 @@ def mms() -> Iterator[Res[MMS]]:
             yield c
 
 
+def calls_and_messages(*, since: datetime | None = None) -> Iterator[Res[Call | Message | MMS]]:
+    """
+    Same items as calls(), messages() and mms() combined, but only scans each backup once
+    """
+    # since is a hint (e.g. from hpi query), older items may still be returned
+    files = [
+        *_backups('calls-*.xml', since=since),
+        *_backups('sms-*.xml', since=since),
+    ]
+
+    emitted: set[tuple] = set()
+    for p in files:
+        for c in _extract_all(p):
+            if isinstance(c, Exception):
+                yield c
+                continue
+            key = _dedup_key(c)
+            if key in emitted:
+                continue
+            emitted.add(key)
+            yield c
+
+
+def _dedup_key(c: Call | Message | MMS) -> tuple:
+    # same as calls(), messages() and mms() use
+    if isinstance(c, Call):
+        return (Call, c.dt)
+    if isinstance(c, Message):
+        return (Message, c.dt, c.who, c.from_me)
+    return (MMS, c.dt, c.phone_number, c.from_user)
+
+
+def _extract_all(path: Path) -> Iterator[Res[Call | Message | MMS]]:
+    for xml in _iterparse(path, ['call', 'sms', 'mms']):
+        if xml.tag == 'call':
+            yield _parse_call(xml)
+        elif xml.tag == 'sms':
+            yield _parse_message(xml)
+        else:
+            yield from _parse_mms(xml)
+
+
 def _resolve_null_str(value: str | None) -> str | None:
     if value is None:
         return None
@@ -235,89 +478,92 @@ def _resolve_null_str(value: str | None) -> str | None:
 
 
 def _extract_mms(path: Path) -> Iterator[Res[MMS]]:
-    tr = _parse_xml(path)
-    for mxml in tr.findall('mms'):
-        dt = mxml.get('date')
-        dt_readable = mxml.get('readable_date')
-        message_type = mxml.get('msg_box')
-
-        who = mxml.get('contact_name')
-        if who is not None and who in UNKNOWN:
-            who = None
-        phone_number = mxml.get('address')
-
-        if dt is None or dt_readable is None or message_type is None or phone_number is None:
-            mxml_str = etree.tostring(mxml).decode('utf-8')
-            yield RuntimeError(
-                f'Missing one or more required attributes [date, readable_date, msg_box, address] in {mxml_str}'
-            )
-            continue
+    for mxml in _iterparse(path, ['mms']):
+        yield from _parse_mms(mxml)
 
-        addresses: list[tuple[str, int]] = []
-        for addr_parent in mxml.findall('addrs'):
-            for addr in addr_parent.findall('addr'):
-                addr_data = addr.attrib
-                user_address = addr_data.get('address')
-                user_type = addr_data.get('type')
-                if user_address is None or user_type is None:
-                    addr_str = etree.tostring(addr_parent).decode()
-                    yield RuntimeError(f'Missing one or more required attributes [address, type] in {addr_str}')
-                    continue
-                if not user_type.isdigit():
-                    yield RuntimeError(f'Invalid address type {user_type} {type(user_type)}, cannot convert to number')
-                    continue
-                addresses.append((user_address, int(user_type)))
-
-        content: list[MMSContentPart] = []
-
-        for part_root in mxml.findall('parts'):
-            for part in part_root.findall('part'):
-                # the first item is an SMIL XML element encoded as a string which describes
-                # how the rest of the parts are laid out
-                # https://www.w3.org/TR/SMIL3/smil-timing.html#Timing-TimeContainerSyntax
-                # An example:
-                # <smil><head><layout><root-layout/><region id="Text" top="0" left="0" height="100%" width="100%"/></layout></head><body><par dur="5000ms"><text src="text.000000.txt" region="Text" /></par></body></smil>
-                #
-                # This seems pretty useless, so we should try and skip it, and just return the
-                # text/images/data
-                part_data: dict[str, Any] = part.attrib
-                seq: str | None = part_data.get('seq')
-                if seq == '-1':
-                    continue
-
-                if seq is None or not seq.isdigit():
-                    yield RuntimeError(f'seq must be a number, was seq={seq} {type(seq)} in {part_data}')
-                    continue
-
-                charset_type: str | None = _resolve_null_str(part_data.get('ct'))
-                filename: str | None = _resolve_null_str(part_data.get('name'))
-                # in some cases (images, cards), the filename is set in 'cl' instead
-                if filename is None:
-                    filename = _resolve_null_str(part_data.get('cl'))
-                text: str | None = _resolve_null_str(part_data.get('text'))
-                data: str | None = _resolve_null_str(part_data.get('data'))
-
-                if charset_type is None or filename is None or (text is None and data is None):
-                    yield RuntimeError(
-                        f'Missing one or more required attributes [ct, name, (text, data)] must be present in {part_data}'
-                    )
-                    continue
-
-                content.append(
-                    MMSContentPart(
-                        sequence_index=int(seq), content_type=charset_type, filename=filename, text=text, data=data
-                    )
-                )
 
-        yield MMS(
-            dt=_parse_dt_ms(dt),
-            dt_readable=dt_readable,
-            who=who,
-            phone_number=phone_number,
-            message_type=int(message_type),
-            parts=content,
-            addresses=addresses,
+def _parse_mms(mxml: Any) -> Iterator[Res[MMS]]:
+    dt = mxml.get('date')
+    dt_readable = mxml.get('readable_date')
+    message_type = mxml.get('msg_box')
+
+    who = mxml.get('contact_name')
+    if who is not None and who in UNKNOWN:
+        who = None
+    phone_number = mxml.get('address')
+
+    if dt is None or dt_readable is None or message_type is None or phone_number is None:
+        mxml_str = etree.tostring(mxml).decode('utf-8')
+        yield RuntimeError(
+            f'Missing one or more required attributes [date, readable_date, msg_box, address] in {mxml_str}'
         )
+        return
+
+    addresses: list[tuple[str, int]] = []
+    for addr_parent in mxml.findall('addrs'):
+        for addr in addr_parent.findall('addr'):
+            addr_data = addr.attrib
+            user_address = addr_data.get('address')
+            user_type = addr_data.get('type')
+            if user_address is None or user_type is None:
+                addr_str = etree.tostring(addr_parent).decode()
+                yield RuntimeError(f'Missing one or more required attributes [address, type] in {addr_str}')
+                continue
+            if not user_type.isdigit():
+                yield RuntimeError(f'Invalid address type {user_type} {type(user_type)}, cannot convert to number')
+                continue
+            addresses.append((user_address, int(user_type)))
+
+    content: list[MMSContentPart] = []
+
+    for part_root in mxml.findall('parts'):
+        for part in part_root.findall('part'):
+            # the first item is an SMIL XML element encoded as a string which describes
+            # how the rest of the parts are laid out
+            # https://www.w3.org/TR/SMIL3/smil-timing.html#Timing-TimeContainerSyntax
+            # An example:
+            # <smil><head><layout><root-layout/><region id="Text" top="0" left="0" height="100%" width="100%"/></layout></head><body><par dur="5000ms"><text src="text.000000.txt" region="Text" /></par></body></smil>
+            #
+            # This seems pretty useless, so we should try and skip it, and just return the
+            # text/images/data
+            part_data: dict[str, Any] = part.attrib
+            seq: str | None = part_data.get('seq')
+            if seq == '-1':
+                continue
+
+            if seq is None or not seq.isdigit():
+                yield RuntimeError(f'seq must be a number, was seq={seq} {type(seq)} in {part_data}')
+                continue
+
+            charset_type: str | None = _resolve_null_str(part_data.get('ct'))
+            filename: str | None = _resolve_null_str(part_data.get('name'))
+            # in some cases (images, cards), the filename is set in 'cl' instead
+            if filename is None:
+                filename = _resolve_null_str(part_data.get('cl'))
+            text: str | None = _resolve_null_str(part_data.get('text'))
+            data: str | None = _resolve_null_str(part_data.get('data'))
+
+            if charset_type is None or filename is None or (text is None and data is None):
+                yield RuntimeError(
+                    f'Missing one or more required attributes [ct, name, (text, data)] must be present in {part_data}'
+                )
+                continue
+
+            content.append(
+                MMSContentPart(
+                    sequence_index=int(seq), content_type=charset_type, filename=filename, text=text, data=data
+                )
+            )
+
+    yield MMS(
+        dt=_parse_dt_ms(dt),
+        dt_readable=dt_readable,
+        who=who,
+        phone_number=phone_number,
+        message_type=int(message_type),
+        parts=content,
+        addresses=addresses,
+    )
 
 
 # See https://github.com/karlicoss/HPI/pull/90#issuecomment-702422351
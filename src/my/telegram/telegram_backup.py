@@ -13,6 +13,7 @@ from struct import calcsize, unpack_from
 
 from my.config import telegram as user_config
 from my.core import datetime_aware, make_logger
+from my.core.query import ordered_by
 from my.core.sqlite import sqlite_connection
 
 logger = make_logger(__name__, level='debug')
@@ -95,10 +96,27 @@ def _message_from_row(r: sqlite3.Row, *, chats: Chats, with_extra_media_info: bo
     )
 
 
-def messages(*, extra_where: str | None = None, with_extra_media_info: bool = False) -> Iterator[Message]:
+@ordered_by('time', is_sorted=True)
+def messages(
+    *,
+    extra_where: str | None = None,
+    with_extra_media_info: bool = False,
+    since: datetime | None = None,
+    until: datetime | None = None,
+) -> Iterator[Message]:
+    """
+    since/until (inclusive/exclusive) are passed by hpi query, to only read messages within the range
+    """
     messages_query = 'SELECT * FROM messages WHERE message_type NOT IN ("service_message", "empty_message")'
+    params: list[float] = []
     if extra_where is not None:
         messages_query += ' AND ' + extra_where
+    if since is not None:
+        messages_query += ' AND time >= ?'
+        params.append(since.timestamp())
+    if until is not None:
+        messages_query += ' AND time < ?'
+        params.append(until.timestamp())
     messages_query += ' ORDER BY time'
 
     with sqlite_connection(config.export_path, immutable=True, row_factory='row') as db:
@@ -121,7 +139,7 @@ def messages(*, extra_where: str | None = None, with_extra_media_info: bool = Fa
             assert chat.id not in chats
             chats[chat.id] = chat
 
-        for r in db.execute(messages_query):
+        for r in db.execute(messages_query, params):
             # seems like the only remaining have message_type = 'message'
             yield _message_from_row(r, chats=chats, with_extra_media_info=with_extra_media_info)
 
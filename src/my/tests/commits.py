@@ -1,4 +1,6 @@
 import os
+from dataclasses import asdict
+from functools import partial
 from pathlib import Path
 
 import pytest
@@ -24,6 +26,101 @@ def test() -> None:
     # handle later
 
 
+def _by_sha(commits) -> dict[str, dict]:
+    # ref attribution for commits reachable from multiple refs depends on the order they are walked
+    return {c.sha: {**asdict(c), 'ref': None} for c in commits}
+
+
+def _check_backends(repo: Path) -> None:
+    from my.coding.commits import _git_refs, _repo_commits_git, _repo_commits_gitpython
+
+    git_commits = list(_repo_commits_git(repo))
+    assert len(git_commits) == len(_by_sha(git_commits))  # no duplicates
+    assert _by_sha(git_commits) == _by_sha(_repo_commits_gitpython(repo))
+    refs = {ref for ref, _ in _git_refs(repo)}
+    assert {c.ref for c in git_commits} <= refs
+
+
+def test_backends() -> None:
+    _check_backends(hpi_repo_root())
+
+
+def _git(repo: Path, *args: str, name: str = 'Dima') -> None:
+    import subprocess
+
+    env = {
+        **os.environ,
+        'GIT_AUTHOR_NAME': name, 'GIT_AUTHOR_EMAIL': f'{name.lower()}@example.com',
+        'GIT_COMMITTER_NAME': name, 'GIT_COMMITTER_EMAIL': f'{name.lower()}@example.com',
+    }  # fmt: skip
+    subprocess.run(['git', '-C', str(repo), *args], check=True, env=env, capture_output=True)
+
+
+def test_backends_refs(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    import my.coding.commits as M
+
+    repo = tmp_path / 'repo'
+    repo.mkdir()
+    git = partial(_git, repo)
+    git('init', '-q', '-b', 'master')
+    for i in range(3):
+        git('commit', '-q', '--allow-empty', '-m', f'commit {i}')
+    git('checkout', '-q', '-b', 'feature', 'HEAD~1')
+    git('commit', '-q', '--allow-empty', '-m', 'feature commit')
+    git('commit', '-q', '--allow-empty', '-m', 'not my commit', name='Someone')
+    git('tag', 'tag', 'HEAD~1')
+    git('branch', 'other', 'master~2')
+    git('checkout', '-q', 'master')
+
+    _check_backends(repo)
+    assert len(list(M._repo_commits_git(repo))) == 4
+
+    # all refs are walked in a single git log
+    logs = []
+    popen = M.Popen
+
+    def Popen(cmd, *args, **kwargs):
+        logs.append(cmd)
+        return popen(cmd, *args, **kwargs)
+
+    monkeypatch.setattr(M, 'Popen', Popen)
+    list(M._repo_commits_git(repo))
+    assert len(logs) == 1
+
+
+def test_incremental(tmp_path: Path) -> None:
+    from my.coding.commits import _repo_commits_git, _repo_commits_incremental
+    from my.core.core_config import _reset_config as reset
+
+    repo = tmp_path / 'repo'
+    git = partial(_git, repo)
+
+    def shas(commits) -> list[str]:
+        return sorted(c.sha for c in commits)
+
+    repo.mkdir()
+    git('init', '-q')
+    for i in range(3):
+        git('commit', '-q', '--allow-empty', '-m', f'commit {i}')
+
+    with reset() as cc:
+        cc.cache_dir = tmp_path / 'cache'
+
+        assert len(shas(_repo_commits_incremental(repo))) == 3
+
+        git('commit', '-q', '--allow-empty', '-m', 'new commit')
+        git('tag', 'tag', 'HEAD~1')
+        res = list(_repo_commits_incremental(repo))
+        assert shas(res) == shas(_repo_commits_git(repo))
+        assert res[-1].message == 'new commit'  # appended to the previously indexed commits
+
+        # history rewritten, so the index has to be rebuilt
+        git('reset', '-q', '--hard', 'HEAD~2')
+        git('tag', '-d', 'tag')
+        assert shas(_repo_commits_incremental(repo)) == shas(_repo_commits_git(repo))
+        assert len(shas(_repo_commits_git(repo))) == 2
+
+
 @pytest.fixture(autouse=True)
 def prepare(tmp_path: Path):
     # TODO maybe test against actual testdata, could check for
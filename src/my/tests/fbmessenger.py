@@ -0,0 +1,100 @@
+import gc
+import json
+import sqlite3
+import weakref
+from collections.abc import Iterator
+from itertools import islice
+from pathlib import Path
+
+import pytest
+
+from my.core.cfg import tmp_config
+from my.fbmessenger.android import Message, _replied_to_ids, messages
+
+# m2 replies to m1, m3 isn't replied to
+MESSAGES = [
+    ('m1', 1600000000000, 'hello', None),
+    ('m2', 1600000001000, 'reply to hello', 'm1'),
+    ('m3', 1600000002000, 'bye', None),
+]
+
+
+def _make_msys_db(db: Path) -> None:
+    with sqlite3.connect(db) as conn:
+        conn.execute('CREATE TABLE logging_events_v2 (id)')
+        conn.execute('CREATE TABLE contacts (id INTEGER, name TEXT)')
+        conn.execute('CREATE TABLE participants (thread_key INTEGER, contact_id INTEGER)')
+        conn.execute('CREATE TABLE threads (thread_key INTEGER, thread_name TEXT, thread_type INTEGER)')
+        conn.execute('CREATE TABLE messages (message_id TEXT, timestamp_ms INTEGER, text TEXT, thread_key INTEGER, sender_id INTEGER, reply_source_id TEXT, offline_threading_id TEXT)')  # fmt: skip
+        conn.execute("INSERT INTO contacts VALUES (123, 'Alice')")
+        conn.execute('INSERT INTO participants VALUES (1, 123)')
+        conn.execute("INSERT INTO threads VALUES (1, 'chat', 1)")
+        for mid, ts, text, reply_to in MESSAGES:
+            conn.execute(
+                'INSERT INTO messages VALUES (?, ?, ?, 1, 123, ?, ?)', (mid, ts, text, reply_to, f'offline_{mid}')
+            )
+    conn.close()
+
+
+def _make_threads_db2(db: Path) -> None:
+    with sqlite3.connect(db) as conn:
+        conn.execute('CREATE TABLE thread_users (user_key TEXT, name TEXT)')
+        conn.execute('CREATE TABLE thread_participants (thread_key TEXT, user_key TEXT)')
+        conn.execute('CREATE TABLE threads (thread_key TEXT, name TEXT)')
+        conn.execute('CREATE TABLE messages (msg_id TEXT, timestamp_ms INTEGER, text TEXT, thread_key TEXT, sender TEXT, msg_type INTEGER, message_replied_to_id TEXT)')  # fmt: skip
+        conn.execute("INSERT INTO thread_users VALUES ('FACEBOOK:123', 'Alice')")
+        conn.execute("INSERT INTO thread_participants VALUES ('GROUP:1', 'FACEBOOK:123')")
+        conn.execute("INSERT INTO threads VALUES ('GROUP:1', 'chat')")
+        sender = json.dumps({'user_key': 'FACEBOOK:123'})
+        for mid, ts, text, reply_to in MESSAGES:
+            conn.execute(
+                'INSERT INTO messages VALUES (?, ?, ?, ?, ?, 0, ?)', (mid, ts, text, 'GROUP:1', sender, reply_to)
+            )
+    conn.close()
+
+
+@pytest.fixture(params=['msys', 'threads_db2'])
+def export_path(request, tmp_path: Path) -> Iterator[Path]:
+    db = tmp_path / f'{request.param}.db'
+    if request.param == 'msys':
+        _make_msys_db(db)
+    else:
+        _make_threads_db2(db)
+
+    class user_config:
+        class android:
+            export_path = db
+
+    with tmp_config() as config:
+        config.fbmessenger = user_config
+        yield db
+
+
+@pytest.mark.usefixtures('export_path')
+def test_reply_to() -> None:
+    assert _replied_to_ids() == {'m1'}
+
+    res = list(messages())
+    assert all(isinstance(m, Message) for m in res), res
+    msgs = {m.id: m for m in res if isinstance(m, Message)}
+    assert msgs.keys() == {'m1', 'm2', 'm3'}
+    assert msgs['m2'].reply_to == msgs['m1']
+    assert msgs['m1'].reply_to is None
+    assert msgs['m3'].reply_to is None
+    assert msgs['m1'].thread.name == 'chat'
+    assert msgs['m2'].sender.name == 'Alice'
+
+
+@pytest.mark.usefixtures('export_path')
+def test_only_replied_to_kept() -> None:
+    it = messages()
+    # not exhausting the generator, so it's still holding on to its state
+    refs = {m.id: weakref.ref(m) for m in islice(it, len(MESSAGES)) if isinstance(m, Message)}
+    assert refs.keys() == {'m1', 'm2', 'm3'}
+    gc.collect()
+    # should only keep the message that's replied to
+    # (m3 is still referenced by the generator frame since it's the last one yielded, so not checking it)
+    alive = {mid for mid, ref in refs.items() if ref() is not None}
+    assert 'm1' in alive
+    assert 'm2' not in alive
+    del it
@@ -0,0 +1,118 @@
+from __future__ import annotations
+
+from collections.abc import Iterator
+from datetime import UTC, datetime
+from pathlib import Path
+from types import ModuleType
+
+import pytest
+from google_takeout_parser.models import Activity
+
+from my.core.cfg import tmp_config
+
+
+def _activity(title: str) -> Activity:
+    return Activity(
+        header='YouTube',
+        title=title,
+        time=datetime(2026, 7, 18, tzinfo=UTC),
+        description=None,
+        titleUrl=None,
+        subtitles=[],
+        details=[],
+        locationInfos=[],
+        products=['YouTube'],
+    )
+
+
+@pytest.fixture
+def takeout_path(tmp_path: Path) -> Path:
+    takeout_path = tmp_path / 'takeouts'
+    takeout_path.mkdir()
+    return takeout_path
+
+
+@pytest.fixture
+def parser(takeout_path: Path, tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Iterator[ModuleType]:
+    cachew = pytest.importorskip('cachew')
+    from my.core.core_config import _reset_config as reset
+
+    # conftest disables cachew by default
+    monkeypatch.setattr(cachew.settings, 'ENABLE', True)
+
+    data = takeout_path
+
+    class config:
+        class google:
+            takeout_path = data
+
+    # NOTE: cache dir needs to be set before the module is (re)loaded, since mcachew picks it up on import
+    with reset() as cc:
+        cc.cache_dir = tmp_path / 'cache'
+        with tmp_config(modules='my.google.takeout.parser', config=config):
+            import my.google.takeout.parser
+
+            yield my.google.takeout.parser
+
+
+def _merged(parser: ModuleType, monkeypatch: pytest.MonkeyPatch) -> tuple[list[str], list[str]]:
+    """returns merged event titles, and names of the takeouts that were actually parsed"""
+    parsed = []
+
+    def takeout_events(path: Path, *, disable_takeout_cache: bool) -> Iterator[Activity]:
+        parsed.append(path.name)
+        # each takeout has the events from the older ones and a new one ('shared' is in all of them)
+        for line in path.read_text().splitlines():
+            yield _activity(line)
+
+    monkeypatch.setattr(parser, '_takeout_events', takeout_events)
+    titles = [e.title for e in parser.events()]
+    return sorted(titles), parsed
+
+
+def test_merged_events_incremental(parser: ModuleType, takeout_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    (takeout_path / 'takeout-1').write_text('shared\none')
+    (takeout_path / 'takeout-3').write_text('shared\nthree')
+    assert _merged(parser, monkeypatch) == (['one', 'shared', 'three'], ['takeout-3', 'takeout-1'])
+    # cached
+    assert _merged(parser, monkeypatch) == (['one', 'shared', 'three'], [])
+
+    # newer takeout, only it should be parsed
+    (takeout_path / 'takeout-4').write_text('shared\nfour')
+    assert _merged(parser, monkeypatch) == (['four', 'one', 'shared', 'three'], ['takeout-4'])
+
+
+def test_merged_events_removed(parser: ModuleType, takeout_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    for i in [1, 2, 3]:
+        (takeout_path / f'takeout-{i}').write_text(f'shared\n{i}')
+    assert _merged(parser, monkeypatch)[0] == ['1', '2', '3', 'shared']
+
+    # removed takeout in the middle (along with a newer one added), its events shouldn't stay in the cache
+    (takeout_path / 'takeout-2').unlink()
+    (takeout_path / 'takeout-4').write_text('shared\n4')
+    assert _merged(parser, monkeypatch) == (['1', '3', '4', 'shared'], ['takeout-4', 'takeout-3', 'takeout-1'])
+
+    # same for a replaced one
+    (takeout_path / 'takeout-3').write_text('shared\n3 replaced')
+    (takeout_path / 'takeout-3').rename(takeout_path / 'takeout-3-replaced')
+    (takeout_path / 'takeout-5').write_text('shared\n5')
+    titles, parsed = _merged(parser, monkeypatch)
+    assert titles == ['1', '3 replaced', '4', '5', 'shared']
+    assert parsed == ['takeout-5', 'takeout-4', 'takeout-3-replaced', 'takeout-1']
+
+
+def test_merged_events_inserted(parser: ModuleType, takeout_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    (takeout_path / 'takeout-1').write_text('shared\none')
+    (takeout_path / 'takeout-3').write_text('shared\nthree')
+    assert _merged(parser, monkeypatch)[0] == ['one', 'shared', 'three']
+
+    # new takeout which sorts before the last cached one, shouldn't be skipped
+    (takeout_path / 'takeout-2').write_text('shared\ntwo')
+    (takeout_path / 'takeout-4').write_text('shared\nfour')
+    titles, parsed = _merged(parser, monkeypatch)
+    assert titles == ['four', 'one', 'shared', 'three', 'two']
+    assert parsed == ['takeout-4', 'takeout-3', 'takeout-2', 'takeout-1']
+
+    # appended after that, incremental again
+    (takeout_path / 'takeout-5').write_text('shared\nfive')
+    assert _merged(parser, monkeypatch) == (['five', 'four', 'one', 'shared', 'three', 'two'], ['takeout-5'])
@@ -117,6 +117,26 @@ def test_ip_fallback() -> None:
     assert (loc.lat, loc.lon) != (bulgaria.lat, bulgaria.lon)
 
 
+def test_ip_fallback_batch() -> None:
+    dts = [
+        datetime(2020, 1, 1, 11, 59, 59, tzinfo=UTC),
+        datetime(2020, 1, 1, 12, 30, 0, tzinfo=UTC),
+        datetime(2020, 2, 1, 12, 30, 0, tzinfo=UTC),
+        datetime(2020, 2, 1, 17, 00, 0, tzinfo=UTC),
+        datetime(2020, 2, 2, 15, 30, 0, tzinfo=UTC),
+        datetime(2020, 3, 1, 12, 15, 0, tzinfo=UTC),
+    ]
+    expected = [list(via_ip.estimate_location(dt)) for dt in dts]
+    assert [len(e) for e in expected] == [0, 1, 1, 2, 1, 1]
+
+    # sorted input -- single pass over the index
+    assert list(via_ip.estimate_locations(dts)) == expected
+    # epoch timestamps should work too
+    assert list(via_ip.estimate_locations([dt.timestamp() for dt in dts])) == expected
+    # out of order input should still give the same results
+    assert list(via_ip.estimate_locations(reversed(dts))) == list(reversed(expected))
+
+
 def data() -> Iterator[IP]:
     # random IP addresses
     yield IP(addr="67.98.113.0", dt=datetime(2020, 1, 1, 12, 0, 0, tzinfo=UTC))
@@ -141,6 +161,7 @@ def prepare(config, monkeypatch: pytest.MonkeyPatch):
         return _IPGEO_CACHE[ip.addr]
 
     via_ip._sorted_fallback_locations.cache_clear()
+    via_ip._fallback_index.cache_clear()
     # redefine the my.ip.all function using data for testing
     monkeypatch.setattr(ip_module, "ips", data)
     # CI runs this test across a matrix, so real ipinfo.io requests can hit its rate limit.
@@ -149,3 +170,4 @@ def prepare(config, monkeypatch: pytest.MonkeyPatch):
         yield
     finally:
         via_ip._sorted_fallback_locations.cache_clear()
+        via_ip._fallback_index.cache_clear()
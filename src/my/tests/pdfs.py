@@ -33,6 +33,49 @@ def test_with_error(with_config, tmp_path: Path) -> None:
     assert isinstance(annot, Exception)
 
 
+def test_per_file_cache(tmp_path: Path, monkeypatch) -> None:
+    import os
+    import shutil
+
+    cachew = pytest.importorskip('cachew')
+    from my.core.core_config import _reset_config as reset
+
+    # conftest disables cachew by default
+    monkeypatch.setattr(cachew.settings, 'ENABLE', True)
+
+    root = tmp_path / 'pdfs'
+    root.mkdir()
+    src = testdata() / 'pdfs' / 'Information Architecture for the World Wide Web.pdf'
+    for name in ['a.pdf', 'b.pdf']:
+        shutil.copy(src, root / name)
+
+    class config:
+        class pdfs:
+            paths = (root,)
+
+    # NOTE: cache dir needs to be set before the module is (re)loaded, since mcachew picks up the default on import
+    with reset() as cc:
+        cc.cache_dir = tmp_path / 'cache'
+        with tmp_config(modules='my.pdfs', config=config):
+            from my.pdfs import annotations
+
+            first = list(annotations())
+            assert len(first) == 6
+
+            # only per-file caches, annotations aren't cached for the whole library again
+            assert [p.name for p in (tmp_path / 'cache').iterdir()] == ['my.pdfs']
+            cache_files = sorted((tmp_path / 'cache' / 'my.pdfs').iterdir())
+            assert len(cache_files) == 2
+            mtimes = {p: p.stat().st_mtime_ns for p in cache_files}
+
+            # only the modified pdf should be processed again
+            st = (root / 'b.pdf').stat()
+            os.utime(root / 'b.pdf', ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+            assert list(annotations()) == first
+            changed = [p.name for p in cache_files if p.stat().st_mtime_ns != mtimes[p]]
+            assert changed == [c.name for c in cache_files if c.name.endswith('b_pdf')]
+
+
 @pytest.fixture
 def with_config():
     # extra_data = Path(__file__).absolute().parent / 'extra/data/polar'
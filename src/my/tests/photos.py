@@ -0,0 +1,141 @@
+from __future__ import annotations
+
+import os
+from collections.abc import Iterator
+from datetime import datetime
+from pathlib import Path
+from types import ModuleType
+
+import pytest
+
+from my.core.cfg import tmp_config
+
+PIL_Image = pytest.importorskip('PIL.Image')
+pytest.importorskip('geopy')
+pytest.importorskip('magic')
+
+
+def _write_jpeg(path: Path, *, dt: str) -> None:
+    im = PIL_Image.new('RGB', (4, 4))
+    exif = PIL_Image.Exif()
+    exif.get_ifd(0x8769)[0x9003] = dt  # ExifIFD -> DateTimeOriginal
+    im.save(path, exif=exif)
+
+
+@pytest.fixture
+def root(tmp_path: Path) -> Path:
+    root = tmp_path / 'photos'
+    root.mkdir()
+    return root
+
+
+@pytest.fixture
+def photos(root: Path, tmp_path: Path) -> Iterator[ModuleType]:
+    from my.core.core_config import _reset_config as reset
+
+    class config:
+        class photos:
+            paths = (str(root),)
+            geocoder = None
+
+            @staticmethod
+            def ignored(_p: Path) -> bool:
+                return False
+
+    with tmp_config(modules='my.photos.main', config=config), reset() as cc:
+        cc.cache_dir = tmp_path / 'cache'
+        import my.photos.main as M
+
+        yield M
+
+
+@pytest.fixture
+def extracted(photos: ModuleType, monkeypatch: pytest.MonkeyPatch) -> list[str]:
+    """names of the photos exif was actually extracted from"""
+    res: list[str] = []
+    extract_exif = photos._extract_exif
+
+    def _extract_exif(photo: Path):
+        res.append(photo.name)
+        return extract_exif(photo)
+
+    monkeypatch.setattr(photos, '_extract_exif', _extract_exif)
+    return res
+
+
+def _photos(photos: ModuleType, root: Path) -> list:
+    # NOTE: not using photos.photos(), it relies on fdfind
+    candidates = [(str(p), 'image/jpeg') for p in sorted(root.iterdir())]
+    return list(photos._photos(candidates))
+
+
+def test_exif_index_cache_hit(photos: ModuleType, root: Path, extracted: list[str]) -> None:
+    _write_jpeg(root / 'a.jpg', dt='2020:01:02 03:04:05')
+    _write_jpeg(root / 'b.jpg', dt='2021:01:02 03:04:05')
+
+    first = _photos(photos, root)
+    assert [p.dt for p in first] == [datetime(2020, 1, 2, 3, 4, 5), datetime(2021, 1, 2, 3, 4, 5)]
+    assert extracted == ['a.jpg', 'b.jpg']
+
+    # served from the index
+    extracted.clear()
+    assert _photos(photos, root) == first
+    assert extracted == []
+
+
+def test_exif_index_invalidated(photos: ModuleType, root: Path, extracted: list[str]) -> None:
+    _write_jpeg(root / 'a.jpg', dt='2020:01:02 03:04:05')
+    _write_jpeg(root / 'b.jpg', dt='2021:01:02 03:04:05')
+    _photos(photos, root)
+
+    # changed file (size and mtime)
+    _write_jpeg(root / 'b.jpg', dt='2022:01:02 03:04:05')
+    st = (root / 'b.jpg').stat()
+    os.utime(root / 'b.jpg', ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+    extracted.clear()
+    assert [p.dt for p in _photos(photos, root)] == [datetime(2020, 1, 2, 3, 4, 5), datetime(2022, 1, 2, 3, 4, 5)]
+    assert extracted == ['b.jpg']
+
+    # removed file is dropped from the index
+    (root / 'a.jpg').unlink()
+    extracted.clear()
+    assert [p.dt for p in _photos(photos, root)] == [datetime(2022, 1, 2, 3, 4, 5)]
+    assert extracted == []
+    assert photos._ExifIndex(photos._cache_db_path('exif.sqlite')).rows.keys() == {str(root / 'b.jpg')}
+
+
+def test_exif_index_errors(
+    photos: ModuleType, root: Path, extracted: list[str], monkeypatch: pytest.MonkeyPatch
+) -> None:
+    _write_jpeg(root / 'a.jpg', dt='2020:01:02 03:04:05')
+    _photos(photos, root)
+
+    # e.g. file was temporarily unavailable
+    extract_exif = photos._extract_exif
+    fail = True
+
+    def flaky_extract_exif(photo: Path):
+        if fail:
+            extracted.append(photo.name)
+            raise OSError('whoops')
+        return extract_exif(photo)
+
+    monkeypatch.setattr(photos, '_extract_exif', flaky_extract_exif)
+    _write_jpeg(root / 'b.jpg', dt='2021:01:02 03:04:05')
+    extracted.clear()
+    [a, err, b] = _photos(photos, root)
+    assert isinstance(err, OSError)
+    assert a.dt == datetime(2020, 1, 2, 3, 4, 5)
+    assert b.dt is None  # falls back onto the file name, which doesn't have a date
+    assert extracted == ['b.jpg']
+
+    # error isn't cached, so processed again
+    fail = False
+    extracted.clear()
+    assert [p.dt for p in _photos(photos, root)] == [datetime(2020, 1, 2, 3, 4, 5), datetime(2021, 1, 2, 3, 4, 5)]
+    assert extracted == ['b.jpg']
+
+    # now it's cached
+    extracted.clear()
+    _photos(photos, root)
+    assert extracted == []
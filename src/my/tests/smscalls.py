@@ -0,0 +1,214 @@
+from __future__ import annotations
+
+from collections.abc import Iterator
+from datetime import UTC, datetime
+from pathlib import Path
+from types import ModuleType
+
+import pytest
+
+from my.core.cfg import tmp_config
+
+pytest.importorskip('lxml')
+
+
+CALLS = '''<?xml version="1.0" encoding="UTF-8" standalone="yes" ?>
+<calls count="3">
+  <call number="+1234" duration="42" date="1600000000000" type="2" readable_date="13 Sep 2020 13:26:40" contact_name="Alice" />
+  <call number="+5678" duration="0" date="1600000060000" type="3" readable_date="13 Sep 2020 13:27:40" contact_name="(Unknown)" />
+  <call number="+1234" date="1600000120000" />
+</calls>
+'''
+
+SMSES = '''<?xml version="1.0" encoding="UTF-8" standalone="yes" ?>
+<smses count="3">
+  <sms address="+1234" date="1600000000000" type="1" body="hi there" readable_date="13 Sep 2020 13:26:40" contact_name="Alice" />
+  <mms date="1600000030000" msg_box="2" address="+1234~+5678" readable_date="13 Sep 2020 13:27:10" contact_name="Alice, Bob">
+    <parts>
+      <part seq="-1" ct="application/smil" name="null" text="&lt;smil&gt;&lt;/smil&gt;" />
+      <part seq="0" ct="text/plain" name="null" cl="text_0.txt" text="look at this" />
+      <part seq="1" ct="image/jpeg" name="photo.jpg" data="aGVsbG8=" />
+    </parts>
+    <addrs>
+      <addr address="+9999" type="137" />
+      <addr address="+1234" type="151" />
+    </addrs>
+  </mms>
+  <sms address="+5678" date="1600000060000" type="2" body="bye" readable_date="13 Sep 2020 13:27:40" contact_name="(Unknown)" />
+  <sms address="+5678" date="1600000090000" type="2" readable_date="13 Sep 2020 13:28:10" />
+</smses>
+'''
+
+
+@pytest.fixture
+def export_path(tmp_path: Path) -> Path:
+    export_path = tmp_path / 'smscalls'
+    export_path.mkdir()
+    return export_path
+
+
+@pytest.fixture
+def smscalls(export_path: Path, tmp_path: Path) -> Iterator[ModuleType]:
+    from my.core.core_config import _reset_config as reset
+
+    data = export_path
+
+    class config:
+        class smscalls:
+            export_path = data
+
+    with tmp_config(modules='my.smscalls', config=config), reset() as cc:
+        cc.cache_dir = tmp_path / 'cache'
+        import my.smscalls
+
+        yield my.smscalls
+
+
+def _dt(ts: int) -> datetime:
+    return datetime.fromtimestamp(ts, tz=UTC)
+
+
+def test_calls(smscalls: ModuleType, export_path: Path) -> None:
+    (export_path / 'calls-20200914000000.xml').write_text(CALLS)
+
+    [c1, c2, err] = list(smscalls.calls())
+    assert c1 == smscalls.Call(
+        dt=_dt(1600000000),
+        dt_readable='13 Sep 2020 13:26:40',
+        duration_s=42,
+        phone_number='+1234',
+        who='Alice',
+        call_type=2,
+    )
+    assert c1.from_me
+    assert c2.who is None  # '(Unknown)'
+    assert not c2.from_me
+    assert isinstance(err, RuntimeError)
+
+
+def test_messages(smscalls: ModuleType, export_path: Path) -> None:
+    (export_path / 'sms-20200914000000.xml').write_text(SMSES)
+
+    [m1, m2, err] = list(smscalls.messages())
+    assert m1 == smscalls.Message(
+        dt=_dt(1600000000),
+        dt_readable='13 Sep 2020 13:26:40',
+        who='Alice',
+        message='hi there',
+        phone_number='+1234',
+        message_type=1,
+    )
+    assert m2.who is None
+    assert m2.from_me
+    assert isinstance(err, RuntimeError)
+
+
+def test_mms(smscalls: ModuleType, export_path: Path) -> None:
+    (export_path / 'sms-20200914000000.xml').write_text(SMSES)
+
+    [mms] = list(smscalls.mms())
+    assert mms.dt == _dt(1600000030)
+    assert mms.who == 'Alice, Bob'
+    assert mms.phone_number == '+1234~+5678'
+    assert mms.from_me
+    assert mms.from_user == '+9999'
+    assert mms.addresses == [('+9999', 137), ('+1234', 151)]
+    # smil part is skipped, filename falls back to 'cl'
+    assert mms.parts == [
+        smscalls.MMSContentPart(sequence_index=0, content_type='text/plain', filename='text_0.txt', text='look at this', data=None),
+        smscalls.MMSContentPart(sequence_index=1, content_type='image/jpeg', filename='photo.jpg', text=None, data='aGVsbG8='),
+    ]  # fmt: skip
+
+
+def test_calls_and_messages(smscalls: ModuleType, export_path: Path) -> None:
+    (export_path / 'calls-20200914000000.xml').write_text(CALLS)
+    (export_path / 'sms-20200914000000.xml').write_text(SMSES)
+    # duplicate backup, should be deduplicated
+    (export_path / 'sms-20200915000000.xml').write_text(SMSES)
+
+    combined = list(smscalls.calls_and_messages())
+    separate = [*smscalls.calls(), *smscalls.messages(), *smscalls.mms()]
+    # errors are different objects each time, so comparing reprs
+    assert sorted(map(repr, combined)) == sorted(map(repr, separate))
+    assert len([x for x in combined if not isinstance(x, Exception)]) == 2 + 2 + 1
+
+
+def test_iterparse_clears_other_tags(smscalls: ModuleType, tmp_path: Path) -> None:
+    xml = tmp_path / 'sms.xml'
+    # mms elements after the last sms shouldn't stay in memory
+    mms = '<mms date="1600000030000"><parts><part seq="0" ct="image/jpeg" name="photo.jpg" data="aGVsbG8=" /></parts></mms>'
+    xml.write_text(SMSES.replace('</smses>', 4 * mms + '</smses>'))
+
+    it = smscalls._iterparse(xml, ['sms'])
+    root = next(it).getparent()
+    assert len(list(it)) == 2
+    # everything processed is dropped, except for the last element (which is cleared)
+    assert len(root) == 1
+    [last] = root
+    assert last.tag == 'mms'
+    assert len(last) == 0
+
+
+def _smses(*idxs: int) -> str:
+    smses = ''.join(
+        f'<sms address="+1234" date="{1600000000000 + i * 1000}" type="1" body="message {i}" readable_date="x" contact_name="Alice" />\n'
+        for i in idxs
+    )
+    return f'<?xml version="1.0" encoding="UTF-8" standalone="yes" ?>\n<smses>\n{smses}</smses>\n'
+
+
+def test_covering_backups_superset(smscalls: ModuleType, export_path: Path) -> None:
+    (export_path / 'sms-20200914000000.xml').write_text(_smses(0, 1))
+    (export_path / 'sms-20200915000000.xml').write_text(_smses(0, 1, 2))
+    (export_path / 'sms-20200916000000.xml').write_text(_smses(0, 1, 2, 3))
+
+    # older backups are fully contained in the newest one
+    assert [p.name for p in smscalls._backups('sms-*.xml', since=None)] == ['sms-20200916000000.xml']
+    assert [m.message for m in smscalls.messages()] == [f'message {i}' for i in range(4)]
+
+
+def test_covering_backups_not_nested(smscalls: ModuleType, export_path: Path) -> None:
+    (export_path / 'sms-20200914000000.xml').write_text(_smses(0, 1, 2))
+    # older messages were deleted from the phone
+    (export_path / 'sms-20200915000000.xml').write_text(_smses(2, 3))
+    # same date range as the newest backup, but has a message that's missing in it
+    (export_path / 'sms-20200916000000.xml').write_text(_smses(1, 2, 4))
+    (export_path / 'sms-20200917000000.xml').write_text(_smses(1, 3, 4))
+
+    # 20200915 is covered by the two newer backups together
+    assert [p.name for p in smscalls._backups('sms-*.xml', since=None)] == [
+        'sms-20200914000000.xml',
+        'sms-20200916000000.xml',
+        'sms-20200917000000.xml',
+    ]
+    assert sorted(m.message for m in smscalls.messages()) == [f'message {i}' for i in range(5)]
+
+
+def test_covering_backups_invalidated(smscalls: ModuleType, export_path: Path) -> None:
+    import os
+    import sqlite3
+
+    old = export_path / 'sms-20200914000000.xml'
+    old.write_text(_smses(0, 1))
+    (export_path / 'sms-20200915000000.xml').write_text(_smses(0, 1, 2))
+    assert [p.name for p in smscalls._backups('sms-*.xml', since=None)] == ['sms-20200915000000.xml']
+
+    # modified backup shouldn't use the stale summary from the index
+    old.write_text(_smses(0, 5))
+    assert [p.name for p in smscalls._backups('sms-*.xml', since=None)] == [
+        'sms-20200914000000.xml',
+        'sms-20200915000000.xml',
+    ]
+    assert sorted(m.message for m in smscalls.messages()) == ['message 0', 'message 1', 'message 2', 'message 5']
+
+    # same size, but different mtime
+    old.write_text(_smses(0, 1))
+    st = old.stat()
+    os.utime(old, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+    assert [p.name for p in smscalls._backups('sms-*.xml', since=None)] == ['sms-20200915000000.xml']
+
+    index = smscalls._backup_index_path()
+    with sqlite3.connect(index) as db:
+        [(size, mtime, items)] = db.execute('SELECT size, mtime, items FROM backups WHERE path = ?', (str(old),))
+    db.close()
+    assert (size, mtime, items) == (st.st_size, st.st_mtime + 1, 2)
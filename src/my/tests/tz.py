@@ -1,5 +1,6 @@
 import sys
 from datetime import datetime, timedelta
+from pathlib import Path
 
 import pytest
 import pytz
@@ -42,6 +43,118 @@ def test_iter_tzs(*, fast: bool, config) -> None:
         ]
 
 
+@pytest.mark.parametrize('fast', [False, True])
+def test_iter_tzs_grid_precision(*, fast: bool, config) -> None:
+    config.time.tz.via_location.fast = fast
+
+    exact = list(tz_via_location._iter_tzs())
+
+    config.time.tz.via_location.grid_precision = 3  # ~100m, shouldn't change anything for the test track
+    assert list(tz_via_location._iter_tzs()) == exact
+
+
+def test_iter_tzs_incremental(config, tmp_path: Path) -> None:
+    from my.core.core_config import _reset_config as reset
+
+    exact = list(tz_via_location._iter_tzs())
+
+    with reset() as cc:
+        cc.cache_dir = tmp_path
+        config.time.tz.via_location.incremental = True
+
+        # computed from scratch
+        assert list(tz_via_location._iter_tzs()) == exact
+        assert (tmp_path / 'my.time.tz.via_location' / 'tz_state.json').exists()
+
+        # served from the persisted state, nothing new to process
+        assert list(tz_via_location._iter_tzs()) == exact
+
+
+def test_iter_tzs_incremental_new_locations(config, tmp_path: Path, monkeypatch) -> None:
+    from my.core.core_config import _reset_config as reset
+
+    old_locations = list(tz_via_location._locations())
+    last_dt = max(dt for _, dt in old_locations)
+    new_locations = [
+        # more locations for the last day already processed, in a different zone
+        *(((48.8566, 2.3522), last_dt + timedelta(minutes=m)) for m in range(1, 4)),  # Paris
+        # and for new days
+        *(((35.6762, 139.6503), last_dt + timedelta(days=d, hours=h)) for d in (1, 2) for h in range(3)),  # Tokyo
+    ]
+
+    def set_locations(locs: list) -> None:
+        monkeypatch.setattr(tz_via_location, '_locations', lambda *, sort=False: iter(locs))  # noqa: ARG005
+
+    with reset() as cc:
+        cc.cache_dir = tmp_path / 'cache'
+        config.time.tz.via_location.incremental = True
+
+        set_locations(old_locations)
+        before = list(tz_via_location._iter_tzs())
+
+        # resumes from the persisted state, only processing the new locations
+        set_locations(old_locations + new_locations)
+        incremental = list(tz_via_location._iter_tzs())
+
+    config.time.tz.via_location.incremental = False
+    full = list(tz_via_location._iter_tzs())
+    assert incremental == full
+    assert incremental != before
+    assert incremental[-1].zone == 'Asia/Tokyo'
+
+
+def test_iter_tzs_incremental_old_locations(config, tmp_path: Path, monkeypatch) -> None:
+    from my.core.core_config import _reset_config as reset
+
+    locations = list(tz_via_location._locations())
+    first_dt = min(dt for _, dt in locations)
+    # e.g. a new location source imported later, with data older than what's already processed
+    old_locations = [
+        # more locations for the first day already processed, in a different zone
+        *(((48.8566, 2.3522), first_dt + timedelta(minutes=m)) for m in range(1, 100)),  # Paris
+        # and for days before it
+        *(((35.6762, 139.6503), first_dt - timedelta(days=d, hours=h)) for d in (3, 4) for h in range(3)),  # Tokyo
+    ]
+    # fallback for a day without any exact locations
+    fallback_locations = [((40.7128, -74.0060), first_dt - timedelta(days=10))]  # NY
+
+    def set_locations(locs: list, fallback: list) -> None:
+        monkeypatch.setattr(tz_via_location, '_locations', lambda *, sort=False: iter(locs))  # noqa: ARG005
+        monkeypatch.setattr(tz_via_location, '_fallback_locations', lambda: iter(fallback))
+
+    with reset() as cc:
+        cc.cache_dir = tmp_path / 'cache'
+        config.time.tz.via_location.incremental = True
+
+        set_locations(locations, [])
+        before = list(tz_via_location._iter_tzs())
+
+        # resumes from the persisted state, and picks up the older locations
+        set_locations(locations + old_locations, fallback_locations)
+        incremental = list(tz_via_location._iter_tzs())
+
+        config.time.tz.via_location.incremental = False
+        full = list(tz_via_location._iter_tzs())
+        assert incremental == full
+        assert incremental != before
+        assert [x.zone for x in incremental[:3]] == ['America/New_York', 'Asia/Tokyo', 'Asia/Tokyo']
+
+        # and the locations being removed again
+        config.time.tz.via_location.incremental = True
+        set_locations(locations, [])
+        assert list(tz_via_location._iter_tzs()) == before
+
+
+def test_zone_offsets() -> None:
+    for zone in ['UTC', 'Etc/GMT+5', 'Europe/London', 'America/St_Johns', 'Australia/Lord_Howe', 'Asia/Kathmandu']:
+        offsets = tz_via_location._zone_offsets(zone)
+        tz = pytz.timezone(zone)
+        dt = datetime.fromisoformat('2016-01-01 00:00:00+00:00')
+        while dt.year < 2018:
+            assert offsets.local_date(dt.timestamp()) == dt.astimezone(tz).date(), (zone, dt)
+            dt += timedelta(minutes=15)
+
+
 def test_past() -> None:
     """
     Should fallback to the 'home' location provider
@@ -9,18 +9,23 @@ REQUIRES = [
     'timezonefinder',
 ]
 
+import hashlib
 import heapq
+import json
 import os
+from bisect import bisect_right
 from collections import Counter
-from collections.abc import Iterable, Iterator
-from dataclasses import dataclass
-from datetime import date, datetime
+from collections.abc import Callable, Iterable, Iterator
+from dataclasses import dataclass, field
+from datetime import UTC, date, datetime
 from functools import lru_cache
 from itertools import groupby
+from pathlib import Path
 from typing import (
     TYPE_CHECKING,
     Any,
     Protocol,
+    Self,
     TypeAlias,
 )
 
@@ -44,10 +49,19 @@ class config(Protocol):
     # if the accuracy for the location is more than 5km, don't use
     require_accuracy: float = 5_000
 
+    # if set, coordinates are rounded to this many decimal places before looking up the timezone,
+    # so all points within the same grid cell share a single timezonefinder lookup
+    # e.g. 2 decimal places is ~1km, which is plenty for figuring out the timezone
+    grid_precision: int | None = None
+
     # how often (hours) to refresh the cachew timezone cache
     # this may be removed in the future if we opt for dict-based caching
     _iter_tz_refresh_time: int = 6
 
+    # if True, zone counts are persisted in the cache dir (per UTC day of the locations), and on refresh
+    # only days which got new/changed/removed locations are resolved again, including older data imported later
+    incremental: bool = False
+
 
 def _get_user_config():
     ## user might not have tz config section, so makes sense to be more defensive about it
@@ -99,11 +113,12 @@ def _timezone_finder(*, fast: bool) -> Any:
 
 
 # for backwards compatibility
-def _locations() -> Iterator[tuple[LatLon, datetime_aware]]:
+def _locations(*, sort: bool = False) -> Iterator[tuple[LatLon, datetime_aware]]:
     try:
         import my.location.all
 
-        for loc in my.location.all.locations():
+        locs = my.location.all.sorted_locations() if sort else my.location.all.locations()
+        for loc in locs:
             if loc.accuracy is not None and loc.accuracy > config.require_accuracy:
                 continue
             yield ((loc.lat, loc.lon), loc.dt)
@@ -117,14 +132,15 @@ def _locations() -> Iterator[tuple[LatLon, datetime_aware]]:
 
         import my.location.google
 
-        for gloc in my.location.google.locations():
+        glocs = my.location.google.locations()
+        if sort:
+            glocs = sorted(glocs, key=lambda l: l.dt)
+        for gloc in glocs:
             yield ((gloc.lat, gloc.lon), gloc.dt)
 
 
-# TODO: could use heapmerge or sort the underlying iterators somehow?
-# see https://github.com/karlicoss/HPI/pull/237#discussion_r858372934
-def _sorted_locations() -> list[tuple[LatLon, datetime_aware]]:
-    return sorted(_locations(), key=lambda x: x[1])
+def _sorted_locations() -> Iterator[tuple[LatLon, datetime_aware]]:
+    return _locations(sort=True)
 
 
 # todo move to common?
@@ -138,31 +154,91 @@ class DayWithZone:
     zone: Zone
 
 
-def _find_tz_for_locs(finder: Any, locs: Iterable[tuple[LatLon, datetime]]) -> Iterator[DayWithZone]:
+def _zone_lookup(finder: Any, *, precision: int | None) -> Callable[[float, float], Zone | None]:
+    if precision is None:
+        return lambda lat, lon: finder.timezone_at(lat=lat, lng=lon)
+
+    # each distinct grid cell is only resolved once
+    cells: dict[LatLon, Zone | None] = {}
+
+    def zone_at(lat: float, lon: float) -> Zone | None:
+        cell = (round(lat, precision), round(lon, precision))
+        if cell not in cells:
+            (clat, clon) = cell
+            cells[cell] = finder.timezone_at(lat=clat, lng=clon)
+        return cells[cell]
+
+    return zone_at
+
+
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+_DAY_SECONDS = 24 * 60 * 60
+
+
+@dataclass
+class _ZoneOffsets:
+    """
+    UTC offsets of a zone along with the (UTC) timestamps they start at.
+    Lets us compute local dates with a bisect and a bit of arithmetic instead of calling dt.astimezone
+    """
+
+    zone: Zone
+    transitions: list[float]
+    offsets: list[float]
+
+    def local_date(self, ts: float) -> date:
+        # same lookup as pytz does in DstTzInfo.fromutc
+        idx = max(bisect_right(self.transitions, ts) - 1, 0)
+        return date.fromordinal(_EPOCH_ORDINAL + int((ts + self.offsets[idx]) // _DAY_SECONDS))
+
+
+@lru_cache(None)
+def _zone_offsets(zone: Zone) -> _ZoneOffsets:
+    tz = pytz.timezone(zone)
+    z = tz.zone
+    assert z is not None
+
+    utc_transition_times: list[datetime] | None = getattr(tz, '_utc_transition_times', None)
+    if utc_transition_times is None:
+        # StaticTzInfo/UTC -- the offset never changes
+        offset = tz.utcoffset(datetime.min)
+        assert offset is not None
+        return _ZoneOffsets(zone=z, transitions=[float('-inf')], offsets=[offset.total_seconds()])
+
+    transition_info = getattr(tz, '_transition_info')
+    return _ZoneOffsets(
+        zone=z,
+        transitions=[t.replace(tzinfo=UTC).timestamp() for t in utc_transition_times],
+        offsets=[utcoffset.total_seconds() for utcoffset, _dst, _tzname in transition_info],
+    )
+
+
+def _find_tz_for_locs(
+    finder: Any,
+    locs: Iterable[tuple[LatLon, datetime]],
+    *,
+    precision: int | None = None,
+) -> Iterator[DayWithZone]:
+    zone_at = _zone_lookup(finder, precision=precision)
     for (lat, lon), dt in locs:
-        # TODO right. it's _very_ slow...
-        zone = finder.timezone_at(lat=lat, lng=lon)
+        zone = zone_at(lat, lon)
         # todo allow to skip if not noo many errors in row?
         if zone is None:
             # warnings.append(f"Couldn't figure out tz for {lat}, {lon}")
             continue
-        tz = pytz.timezone(zone)
-        # TODO this is probably a bit expensive... test & benchmark
-        ldt = dt.astimezone(tz)
-        ndate = ldt.date()
+        offsets = _zone_offsets(zone)
+        ndate = offsets.local_date(dt.timestamp())
         # if pdt is not None and ndate < pdt.date():
         #    # TODO for now just drop and collect the stats
         #    # I guess we'd have minor drops while air travel...
         #    warnings.append("local time goes backwards {ldt} ({tz}) < {pdt}")
         #    continue
         # pdt = ldt
-        z = tz.zone
-        assert z is not None
-        yield DayWithZone(day=ndate, zone=z)
+        yield DayWithZone(day=ndate, zone=offsets.zone)
 
 
-# Note: this takes a while, as the upstream since _locations isn't sorted, so this
-# has to do an iterative sort of the entire my.locations.all list
+# Note: this takes a while, since the sources in my.location.all aren't sorted, they
+# have to be sorted first (see my.location.all.sorted_locations)
 def _iter_local_dates() -> Iterator[DayWithZone]:
     cfg = make_config()
     finder = _timezone_finder(fast=cfg.fast)  # rely on the default
@@ -173,23 +249,24 @@ def _iter_local_dates() -> Iterator[DayWithZone]:
     locs: Iterable[tuple[LatLon, datetime]]
     locs = _sorted_locations() if cfg.sort_locations else _locations()
 
-    yield from _find_tz_for_locs(finder, locs)
+    yield from _find_tz_for_locs(finder, locs, precision=cfg.grid_precision)
 
 
-# my.location.fallback.estimate_location could be used here
-# but iterating through all the locations is faster since this
-# is saved behind cachew
 @import_source(module_name="my.location.fallback.all")
-def _iter_local_dates_fallback() -> Iterator[DayWithZone]:
+def _fallback_locations() -> Iterator[tuple[LatLon, datetime]]:
     from my.location.fallback.all import fallback_locations as flocs
 
-    cfg = make_config()
+    for loc in flocs():
+        yield ((loc.lat, loc.lon), loc.dt)
 
-    def _fallback_locations() -> Iterator[tuple[LatLon, datetime]]:
-        for loc in sorted(flocs(), key=lambda x: x.dt):
-            yield ((loc.lat, loc.lon), loc.dt)
 
-    yield from _find_tz_for_locs(_timezone_finder(fast=cfg.fast), _fallback_locations())
+# my.location.fallback.estimate_location could be used here
+# but iterating through all the locations is faster since this
+# is saved behind cachew
+def _iter_local_dates_fallback() -> Iterator[DayWithZone]:
+    cfg = make_config()
+    locs = sorted(_fallback_locations(), key=lambda x: x[1])
+    yield from _find_tz_for_locs(_timezone_finder(fast=cfg.fast), locs, precision=cfg.grid_precision)
 
 
 def most_common(lst: Iterator[DayWithZone]) -> DayWithZone:
@@ -219,6 +296,10 @@ def _iter_tz_depends_on() -> str:
 # refresh _iter_tzs every few hours -- don't think a better depends_on is possible dynamically
 @mcachew(depends_on=_iter_tz_depends_on)
 def _iter_tzs() -> Iterator[DayWithZone]:
+    if make_config().incremental:
+        yield from _iter_tzs_incremental()
+        return
+
     # since we have no control over what order the locations are returned,
     # we need to sort them first before we can do a groupby
     by_day = lambda p: p.day
@@ -243,6 +324,186 @@ def _iter_tzs() -> Iterator[DayWithZone]:
         yield DayWithZone(day=d, zone=zone)
 
 
+DayCounts = dict[date, Counter[Zone]]
+
+
+@dataclass
+class _Bucket:
+    """
+    Zone counts (by local date) for all locations within a single UTC day, and a digest of these locations
+    """
+
+    digest: str
+    counts: DayCounts
+
+
+def _merge_counts(buckets: dict[date, _Bucket]) -> DayCounts:
+    res: DayCounts = {}
+    # note: Counter preserves insertion order, so zones go in the order they first appear in the locations
+    for b in sorted(buckets):
+        for d, c in buckets[b].counts.items():
+            res.setdefault(d, Counter()).update(c)
+    return res
+
+
+@dataclass
+class _TzState:
+    """
+    Per-UTC-day zone counts for exact and fallback locations
+    """
+
+    # config values the counts were computed with -- if they change, need to recompute from scratch
+    key: str
+    exact: dict[date, _Bucket] = field(default_factory=dict)
+    fallback: dict[date, _Bucket] = field(default_factory=dict)
+
+    def day_zones(self) -> Iterator[DayWithZone]:
+        exact = _merge_counts(self.exact)
+        fallback = _merge_counts(self.fallback)
+        # same as the non-incremental version: fallback is only used for days without exact locations
+        days = sorted(exact.keys() | fallback.keys())
+        for d in days:
+            counts = exact.get(d)
+            if counts is None:
+                counts = fallback[d]
+            # ties are resolved by the earliest zone, same as most_common
+            [(zone, _)] = counts.most_common(1)
+            yield DayWithZone(day=d, zone=zone)
+
+    def to_json(self) -> dict[str, Any]:
+        def dump_buckets(buckets: dict[date, _Bucket]) -> dict[str, Any]:
+            return {
+                b.isoformat(): {
+                    'digest': bucket.digest,
+                    'counts': {d.isoformat(): dict(c) for d, c in bucket.counts.items()},
+                }
+                for b, bucket in buckets.items()
+            }
+
+        return {
+            'version': _TZ_STATE_VERSION,
+            'key': self.key,
+            'exact': dump_buckets(self.exact),
+            'fallback': dump_buckets(self.fallback),
+        }
+
+    @classmethod
+    def from_json(cls, j: dict[str, Any]) -> Self:
+        def load_buckets(buckets: dict[str, Any]) -> dict[date, _Bucket]:
+            return {
+                date.fromisoformat(b): _Bucket(
+                    digest=bucket['digest'],
+                    counts={date.fromisoformat(d): Counter(c) for d, c in bucket['counts'].items()},
+                )
+                for b, bucket in buckets.items()
+            }
+
+        return cls(
+            key=j['key'],
+            exact=load_buckets(j['exact']),
+            fallback=load_buckets(j['fallback']),
+        )
+
+
+_TZ_STATE_VERSION = 2
+
+
+def _tz_state_key(cfg: config) -> str:
+    return f'fast={cfg.fast}_grid_precision={cfg.grid_precision}_require_accuracy={cfg.require_accuracy}'
+
+
+def _tz_state_path() -> Path | None:
+    from my.core import core_config as CC
+
+    cdir = CC.config.get_cache_dir()
+    if cdir is None:
+        return None
+    return cdir / 'my.time.tz.via_location' / 'tz_state.json'
+
+
+def _load_tz_state(path: Path | None, *, key: str) -> _TzState:
+    if path is None or not path.exists():
+        return _TzState(key=key)
+    try:
+        j = json.loads(path.read_text())
+        if j.get('version') != _TZ_STATE_VERSION or j.get('key') != key:
+            logger.info(f"{path} is stale, recomputing from scratch")
+            return _TzState(key=key)
+        return _TzState.from_json(j)
+    except Exception as e:
+        logger.exception(f"error while loading {path}, recomputing from scratch", exc_info=e)
+        return _TzState(key=key)
+
+
+def _save_tz_state(path: Path | None, state: _TzState) -> None:
+    if path is None:
+        return
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # write to a temporary file first so a crash midway doesn't leave broken state behind
+    tmp = path.with_suffix('.tmp')
+    tmp.write_text(json.dumps(state.to_json()))
+    tmp.replace(path)
+
+
+def _locations_digest(locs: list[tuple[LatLon, float]]) -> str:
+    return hashlib.blake2b(repr(locs).encode('utf8'), digest_size=16).hexdigest()
+
+
+def _update_buckets(
+    buckets: dict[date, _Bucket],
+    locs: Iterable[tuple[LatLon, datetime]],
+    *,
+    cfg: config,
+) -> int:
+    """
+    Resolves zones for the UTC days which locations changed on (compared to the digests in buckets), and updates buckets.
+    Returns the number of days resolved again
+
+    NOTE: all locations still have to be read to detect the changes (e.g. older data imported later),
+    but resolving the zones (which is the slow part) only happens for the changed days
+    """
+    by_day: dict[date, list[tuple[LatLon, float]]] = {}
+    for ll, dt in locs:
+        ts = dt.timestamp()
+        by_day.setdefault(date.fromordinal(_EPOCH_ORDINAL + int(ts // _DAY_SECONDS)), []).append((ll, ts))
+
+    # e.g. if a location source was removed
+    for b in buckets.keys() - by_day.keys():
+        del buckets[b]
+
+    finder = _timezone_finder(fast=cfg.fast)
+    changed = 0
+    for b, blocs in by_day.items():
+        # sorted so the digest doesn't depend on the order sources return locations in
+        blocs.sort(key=lambda x: (x[1], x[0]))
+        digest = _locations_digest(blocs)
+        bucket = buckets.get(b)
+        if bucket is not None and bucket.digest == digest:
+            continue
+        counts: DayCounts = {}
+        tlocs = ((ll, datetime.fromtimestamp(ts, tz=UTC)) for ll, ts in blocs)
+        for dz in _find_tz_for_locs(finder, tlocs, precision=cfg.grid_precision):
+            counts.setdefault(dz.day, Counter())[dz.zone] += 1
+        buckets[b] = _Bucket(digest=digest, counts=counts)
+        changed += 1
+    return changed
+
+
+def _iter_tzs_incremental() -> Iterator[DayWithZone]:
+    cfg = make_config()
+    path = _tz_state_path()
+    state = _load_tz_state(path, key=_tz_state_key(cfg))
+
+    changed = _update_buckets(state.exact, _locations(), cfg=cfg)
+    logger.debug(f"resolved exact locations for {changed} (out of {len(state.exact)}) days")
+
+    changed = _update_buckets(state.fallback, _fallback_locations(), cfg=cfg)
+    logger.debug(f"resolved fallback locations for {changed} (out of {len(state.fallback)}) days")
+
+    _save_tz_state(path, state)
+    yield from state.day_zones()
+
+
 @lru_cache(1)
 def _day2zone() -> dict[date, pytz.BaseTzInfo]:
     # NOTE: kinda unfortunate that this will have to process all days before returning result for just one
@@ -16,7 +16,7 @@ from typing import Protocol, assert_never
 
 from my.core import Paths, Res, Stats, datetime_aware, get_files, make_logger, stat
 from my.core.common import unique_everseen
-from my.core.sqlite import sqlite_connection
+from my.core.sqlite import SnapshotDelta, sqlite_connection
 
 import my.config  # isort: skip
 
@@ -99,17 +99,18 @@ def _entities() -> Iterator[Res[_Entity]]:
     paths = inputs()
     total = len(paths)
     width = len(str(total))
+    delta = SnapshotDelta()
     for idx, path in enumerate(paths):
         logger.info(f'processing [{idx:>{width}}/{total:>{width}}] {path}')
         with sqlite_connection(path, immutable=True, row_factory='row') as db:
             try:
-                yield from _handle_db(db)
+                yield from _handle_db(db, delta=delta)
             except Exception as e:
                 e.add_note(f'^ while processing {path}')
                 yield e
 
 
-def _handle_db(db: sqlite3.Connection) -> Iterator[Res[_Entity]]:
+def _handle_db(db: sqlite3.Connection, *, delta: SnapshotDelta) -> Iterator[Res[_Entity]]:
     # profile_user_view contains our own user id
     user_profile_rows = list(db.execute('SELECT * FROM profile_user_view'))
 
@@ -123,9 +124,10 @@ def _handle_db(db: sqlite3.Connection) -> Iterator[Res[_Entity]]:
             [(you_id, _)] = counter.most_common(1)
             yield Person(id=you_id, name='you')
 
+    # most rows are the same across snapshots, so only parsing the ones we haven't seen yet
     for row in chain(
-        user_profile_rows,
-        db.execute('SELECT * FROM match_person'),
+        delta.new_rows('profile_user_view', user_profile_rows),
+        delta.new_rows('match_person', db.execute('SELECT * FROM match_person')),
     ):
         try:
             yield _parse_person(row)
@@ -133,14 +135,14 @@ def _handle_db(db: sqlite3.Connection) -> Iterator[Res[_Entity]]:
             e.add_note(f'^ while parsing {dict(row)}')
             yield e
 
-    for row in db.execute('SELECT * FROM match'):
+    for row in delta.new_rows('match', db.execute('SELECT * FROM match')):
         try:
             yield _parse_match(row)
         except Exception as e:
             e.add_note(f'^ while parsing {dict(row)}')
             yield e
 
-    for row in db.execute('SELECT * FROM message'):
+    for row in delta.new_rows('message', db.execute('SELECT * FROM message')):
         try:
             yield _parse_msg(row)
         except Exception as e:
@@ -18,7 +18,6 @@ from pathlib import Path
 from typing import TYPE_CHECKING
 
 from datetype import AwareDateTime, aware
-from more_itertools import unique_everseen
 
 from my.core import (
     Json,
@@ -30,6 +29,7 @@ from my.core import (
     stat,
     warnings,
 )
+from my.core.common import unique_everseen
 from my.core.serialize import dumps as json_dumps
 
 from .common import TweetId, permalink
@@ -316,7 +316,8 @@ def tweets() -> Iterator[Res[Tweet]]:
 
 def likes() -> Iterator[Res[Like]]:
     _all = chain.from_iterable(ZipExport(i).likes() for i in inputs())
-    res = unique_everseen(_all, key=json_dumps)
+    # json keys are pretty big, so only keeping their digests in memory
+    res = unique_everseen(_all, key=json_dumps, backend='digest')
     # ugh. likes don't have datetimes..
     yield from res
 
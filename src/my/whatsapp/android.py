@@ -13,7 +13,7 @@ from pathlib import Path
 from my.core import Paths, Res, datetime_aware, get_files, make_config, make_logger
 from my.core.common import unique_everseen
 from my.core.error import notnone
-from my.core.sqlite import SqliteTool, sqlite_connection
+from my.core.sqlite import SnapshotDelta, SqliteTool, sqlite_connection
 
 import my.config  # isort: skip
 
@@ -70,7 +70,7 @@ _NO_SENDER_JID_ROW_ID = 0
 _SYSTEM_MESSAGE_TYPE = 7
 
 
-def _process_db(db: sqlite3.Connection) -> Iterator[Entity]:
+def _process_db(db: sqlite3.Connection, *, delta: SnapshotDelta) -> Iterator[Entity]:
     # TODO later, split out Chat/Sender objects separately to safe on object creation, similar to other android data sources
 
     sqlite = SqliteTool(db)
@@ -165,7 +165,9 @@ def _process_db(db: sqlite3.Connection) -> Iterator[Entity]:
     ORDER BY M.timestamp
     '''
 
-    for r in db.execute(message_query):
+    # most messages are the same across snapshots, so only process the ones we haven't seen yet
+    # NOTE: chat/sender changes (e.g. renames) in later snapshots still come through as Chat/Sender entities
+    for r in delta.new_rows('message', db.execute(message_query)):
         msg_id: str = notnone(r['key_id'])
         ts: int = notnone(r['timestamp'])
         dt = datetime.fromtimestamp(ts / 1000, tz=UTC)
@@ -250,17 +252,19 @@ def _entities() -> Iterator[Res[Entity]]:
     paths = inputs()
     total = len(paths)
     width = len(str(total))
+    delta = SnapshotDelta()
     for idx, path in enumerate(paths):
         logger.info(f'processing [{idx:>{width}}/{total:>{width}}] {path}')
         with sqlite_connection(path, immutable=True, row_factory='row') as db:
             try:
-                yield from _process_db(db)
+                yield from _process_db(db, delta=delta)
             except Exception as e:
                 e.add_note(f'^ while processing {path}')
 
 
 def entities() -> Iterator[Res[Entity]]:
-    return unique_everseen(_entities)
+    # messages are the bulk of the data, so only keeping digests of seen entities in memory
+    return unique_everseen(_entities, backend='digest')
 
 
 def messages() -> Iterator[Res[Message]]: